@@ -0,0 +1,84 @@
+# Распределение запросов по пулу точек доступа: быстрая точка, точка, которая
+# посреди прогона начинает тормозить и отвечать ошибками, и точка с почти
+# исчерпанной квотой. Сравнивается выбор по задержке (EndpointPool) и простой
+# перебор по кругу без перехода при ошибке.
+# Запуск из корня репозитория: python -m benchmarks.bench_endpoints
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+import openai
+
+import llm
+from benchmarks.openai_stand_in import StandIn
+from endpoints import Endpoint, EndpointPool
+
+REQUESTS = 300
+CONCURRENCY = 10
+# Лимиты быстрой и нестабильной точек не мешают прогону; у третьей точки — обычные
+# лимиты OpenAI, и она сообщает, что от них осталось 2%
+LARGE_RPM, LARGE_TPM = 100000, 10000000
+MESSAGES = [{"role": "user", "content": "сколько стоит эпиляция"}]
+
+# Перебор по кругу: каждая точка получает свою долю запросов, ошибка не повторяется
+class RoundRobinPool(EndpointPool):
+    def __init__(self, endpoints):
+        super().__init__(endpoints, max_attempts=1)
+        self.order = itertools.cycle(endpoints)
+
+    def candidates(self):
+        return [next(self.order)]
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(int(len(values) * quantile), len(values) - 1)] if values else 0.0
+
+async def run(name, pool, stand_ins):
+    fast, flaky, exhausted = stand_ins
+    fast.delay, flaky.delay, flaky.error_rate, exhausted.delay = 0.05, 0.05, 0.0, 0.05
+    llm.pool = pool
+    latencies, failed, done = [], 0, 0
+    requests = iter(range(REQUESTS))
+
+    async def worker():
+        nonlocal failed, done
+        for _ in requests:
+            done += 1
+            # После трети запросов вторая точка деградирует
+            if done == REQUESTS // 3:
+                flaky.delay, flaky.error_rate = 0.4, 0.5
+            started = time.monotonic()
+            try:
+                await llm.chat_completion(model="gpt-4o", messages=MESSAGES)
+            except openai.error.OpenAIError:
+                failed += 1
+                continue
+            latencies.append(time.monotonic() - started)
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    share = Counter({endpoint.name: endpoint.requests for endpoint in pool.endpoints})
+    print(f"{name:<12} p50={percentile(latencies, 0.5):.3f} s  p95={percentile(latencies, 0.95):.3f} s  "
+          f"failed={failed:<3} failovers={pool.failovers:<3} "
+          + "  ".join(f"{endpoint}={count}" for endpoint, count in sorted(share.items())))
+
+def endpoints(stand_ins):
+    return [Endpoint(name, api_key="local", api_base=stand_in.url(), rpm=stand_in.rpm, tpm=stand_in.tpm)
+            for name, stand_in in zip(("fast", "flaky", "exhausted"), stand_ins)]
+
+async def main():
+    random.seed(0)
+    stand_ins = [StandIn(9301, rpm=LARGE_RPM, tpm=LARGE_TPM), StandIn(9302, rpm=LARGE_RPM, tpm=LARGE_TPM),
+                 StandIn(9303, remaining=0.02)]
+    for stand_in in stand_ins:
+        await stand_in.start()
+    await llm.open_session(None)
+    await run("round-robin", RoundRobinPool(endpoints(stand_ins)), stand_ins)
+    await run("pool", EndpointPool(endpoints(stand_ins)), stand_ins)
+    await llm.close_session(None)
+    for stand_in in stand_ins:
+        await stand_in.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
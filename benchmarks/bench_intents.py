@@ -0,0 +1,93 @@
+# Точность и скорость локального определения типа сообщения на размеченной выборке
+# (фразы не пересекаются с обучающими примерами intents.TRAINING_SAMPLES).
+# Запуск из корня репозитория: python -m benchmarks.bench_intents
+import time
+from collections import Counter
+
+from intents import IntentClassifier
+
+LABELED = [
+    ("добрый вечер", 'greeting'),
+    ("здрасте", 'greeting'),
+    ("Здравствуйте!", 'greeting'),
+    ("assalomu aleykum", 'greeting'),
+    ("ассалому алайкум", 'greeting'),
+    ("hi there", 'greeting'),
+    ("спасибо за информацию", 'thanks'),
+    ("ок, понятно", 'thanks'),
+    ("рахмат", 'thanks'),
+    ("raxmat sizga", 'thanks'),
+    ("thanks!", 'thanks'),
+    ("до встречи", 'goodbye'),
+    ("xayr", 'goodbye'),
+    ("bye bye", 'goodbye'),
+    ("сколько стоит чистка зубов", 'price'),
+    ("цена на лазерную эпиляцию ног", 'price'),
+    ("стоимость консультации дерматолога", 'price'),
+    ("почём биоревитализация", 'price'),
+    ("pilling narxi qancha", 'price'),
+    ("лазер эпиляция нархи қанча", 'price'),
+    ("how much does teeth whitening cost", 'price'),
+    ("какие врачи принимают в субботу", 'doctors'),
+    ("нужен хороший стоматолог, к кому обратиться", 'doctors'),
+    ("dermatolog shifokor bormi", 'doctors'),
+    ("do you have a dermatologist doctor", 'doctors'),
+    ("подскажите адрес клиники", 'contacts'),
+    ("где вы находитесь?", 'contacts'),
+    ("какой у вас номер телефона", 'contacts'),
+    ("во сколько открываетесь", 'contacts'),
+    ("klinika manzili", 'contacts'),
+    ("сизлар қаердасиз", 'contacts'),
+    ("what are your working hours", 'contacts'),
+    ("хочу записаться на чистку лица", 'booking'),
+    ("запишите меня на понедельник", 'booking'),
+    ("как записаться к гинекологу", 'booking'),
+    ("ertaga qabulga yozilsam bo'ladimi", 'booking'),
+    ("can i book for tomorrow", 'booking'),
+    ("что посоветуете от морщин", 'question'),
+    ("можно ли загорать после пилинга", 'question'),
+    ("здравствуйте, у меня выпадают волосы, что делать", 'question'),
+    ("делаете ли вы процедуры беременным", 'question'),
+    ("как подготовиться к лазерной эпиляции", 'question'),
+    ("sochim to'kilyapti nima qilish kerak", 'question'),
+    ("do you treat rosacea", 'question'),
+    ("is botox safe", 'question'),
+    ("пока не знаю что выбрать, что посоветуете для лица", 'question'),
+    # Слова приветствия и прощания внутри других слов, вопросы без ключевых слов
+    ("показания к ботоксу", 'question'),
+    ("показания к плазмолифтингу", 'question'),
+    ("покажите результаты", 'question'),
+    ("кто делает массаж", 'question'),
+    ("какие у вас скидки", 'question'),
+    # Запись в вопросе о цене
+    ("сколько стоит запись к дерматологу", 'price'),
+    ("how much is an appointment with a dermatologist", 'price'),
+    ("what is your email", 'contacts'),
+]
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    classifier = IntentClassifier()
+    print(f"training: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    correct = 0
+    errors = Counter()
+    for text, expected in LABELED:
+        intent = classifier.classify(text)
+        correct += intent.name == expected
+        if intent.name != expected:
+            errors[(expected, intent.name)] += 1
+        print(f"{'+' if intent.name == expected else '-'} {text:<52} {intent.name:<9} {intent.language} "
+              f"{intent.confidence:.2f}")
+    print(f"accuracy {correct}/{len(LABELED)} = {correct / len(LABELED):.2f}")
+    for (expected, actual), count in errors.most_common():
+        print(f"  {expected} -> {actual}: {count}")
+
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text, _ in LABELED:
+            classifier.classify(text)
+    elapsed = time.perf_counter() - started
+    total = rounds * len(LABELED)
+    print(f"{total / elapsed:,.0f} messages/s, {elapsed / total * 1e6:.1f} µs/message")
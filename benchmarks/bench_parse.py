@@ -0,0 +1,45 @@
+# Стоимость разбора одного обновления: полный Update.de_json против peek_update.
+# Запуск из корня репозитория: python -m benchmarks.bench_parse
+import json
+import timeit
+
+from telegram import Bot, Update
+
+from updates import HANDLED_KINDS, peek_update
+
+USER = {"id": 100, "is_bot": False, "first_name": "Пациент", "language_code": "ru"}
+CHAT = {"id": 100, "type": "private", "first_name": "Пациент"}
+
+def message(**fields):
+    return dict({"message_id": 1, "date": 1700000000, "from": USER, "chat": CHAT}, **fields)
+
+# Смесь обновлений, похожая на реальный поток: половина — текст, остальное бот игнорирует
+SAMPLE = [
+    {"update_id": 1, "message": message(text="сколько стоит лазерная эпиляция подмышек")},
+    {"update_id": 2, "message": message(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])},
+    {"update_id": 3, "edited_message": message(text="сколько стоит чистка", edit_date=1700000100)},
+    {"update_id": 4, "message": message(sticker={"file_id": "x", "file_unique_id": "y", "type": "regular",
+                                                 "width": 512, "height": 512, "is_animated": False,
+                                                 "is_video": False})},
+    {"update_id": 5, "message": message(new_chat_members=[USER])},
+    {"update_id": 6, "message": message(text="где вы находитесь")},
+]
+BODIES = [json.dumps(update).encode('utf-8') for update in SAMPLE]
+
+bot = Bot("123:ABC")
+
+def full_parse():
+    for body in BODIES:
+        Update.de_json(json.loads(body), bot)
+
+def lazy_parse():
+    for body in BODIES:
+        summary = peek_update(body)
+        if summary.kind in HANDLED_KINDS:
+            Update.de_json(summary.data, bot)
+
+if __name__ == "__main__":
+    number = 5000
+    for name, func in (("json.loads + Update.de_json", full_parse), ("peek_update + lazy de_json", lazy_parse)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"{name:<30} {seconds / (number * len(BODIES)) * 1e6:6.2f} µs/update")
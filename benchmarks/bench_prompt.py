@@ -0,0 +1,72 @@
+# Стоимость подготовки системных сообщений на одно сообщение пользователя:
+# сборка из каталога при каждом запросе против готового префикса.
+# Также проверяется, что префикс побайтно одинаков для всех языков и вопросов,
+# иначе OpenAI не сможет его кэшировать.
+# Запуск из корня репозитория: python -m benchmarks.bench_prompt
+import json
+import timeit
+import tracemalloc
+
+from bot import CATALOG_INDEX, CONTACT_INFO, DOCTORS, LANGUAGES, SYSTEM_PROMPTS
+from data import services
+
+USER_INPUT = "сколько стоит лазерная эпиляция подмышек"
+
+# Преобразование словаря услуг в текст
+def services_to_text(services):
+    service_text = ""
+    for category, items in services.items():
+        if isinstance(items, dict):
+            service_text += f"{category}:\n"
+            for service, price in items.items():
+                service_text += f"  {service}: {price}\n"
+        else:
+            service_text += f"{category}: {items}\n"
+    return service_text
+
+# Как handle_message собирал сообщения раньше
+def per_message(language='ru'):
+    services_text = services_to_text(services)
+    return [
+        {"role": "system", "content": f"You are a helpful assistant for a medical clinic. Respond in {LANGUAGES[language]}."},
+        {"role": "system", "content": f"Here is the list of services and their prices:\n{services_text}"},
+        {"role": "system", "content": f"Here is the contact information:\n{CONTACT_INFO}"},
+        {"role": "system", "content": f"Here is the information about doctors:\n{DOCTORS}"},
+        {"role": "user", "content": USER_INPUT}
+    ]
+
+def precomputed(language='ru'):
+    return SYSTEM_PROMPTS.build(language, USER_INPUT)
+
+def allocated(func, calls=100):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(calls):
+        func()
+    # Пиковый объём отражает строки, созданные за один вызов
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak
+
+# Длина общего префикса двух запросов в байтах, как его видит кэш OpenAI
+def shared_prefix(first, second):
+    first = json.dumps(first, ensure_ascii=False).encode('utf-8')
+    second = json.dumps(second, ensure_ascii=False).encode('utf-8')
+    length = 0
+    while length < min(len(first), len(second)) and first[length] == second[length]:
+        length += 1
+    return length
+
+if __name__ == "__main__":
+    for layout, build in (("old layout", per_message), ("new layout", precomputed)):
+        print(f"{layout}: shared prefix ru/en {shared_prefix(build('ru'), build('en'))} bytes "
+              f"of {len(json.dumps(build('ru'), ensure_ascii=False).encode('utf-8'))}")
+    other = "есть ли противопоказания к ботоксу"
+    first = SYSTEM_PROMPTS.build('ru', USER_INPUT, CATALOG_INDEX.relevant_text(USER_INPUT))
+    second = SYSTEM_PROMPTS.build('uz', other, CATALOG_INDEX.relevant_text(other))
+    static = len(json.dumps(list(SYSTEM_PROMPTS.prefix), ensure_ascii=False)[:-1].encode('utf-8'))
+    print(f"retrieval: shared prefix {shared_prefix(first, second)} bytes, static part {static} bytes")
+    number = 2000
+    for name, func in (("per-message build", per_message), ("precomputed prefix", precomputed)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"{name:<20} {seconds / number * 1e6:9.2f} µs/message  peak {allocated(func) / 1024:8.1f} KiB")
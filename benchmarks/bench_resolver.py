@@ -0,0 +1,54 @@
+# Точность и скорость прямых ответов на вопросы о цене без OpenAI.
+# Запуск из корня репозитория: python -m benchmarks.bench_resolver
+import time
+
+from catalog import CatalogIndex, has_price_intent
+from data import services
+
+# Вопрос и фрагмент пути, который должен быть у каждой услуги в ответе;
+# None — однозначного ответа в каталоге нет, вопрос должен уйти в OpenAI
+LABELED = [
+    ("сколько стоит лазерная эпиляция подмышек", "подмышечные впадины"),
+    ("сколько стоит первичная консультация гинеколога", "Первичная консультация"),
+    ("сколько стоит дерматоскопия", "Дерматоскопия"),
+    ("стоимость плазмолифтинга", "Плазмолифтинг"),
+    ("сколько стоит лазерная эпиляция голеней для женщин", "голеней (женс)"),
+    ("цена эпиляции голеней", "голеней"),
+    ("сколько стоит эпиляция верхней губы", "верхняя губа"),
+    ("сколько стоит повторная консультация флеболога", "Флеболог"),
+    ("цена пакета full body", "Full Body"),
+    ("сколько стоит эпиляция спины", "спины"),
+    ("сколько стоит эпиляция ног полностью", "ноги полностью"),
+    ("сколько стоит лечение", None),
+    # Лучшая услуга отличается от соседних только словоформой («ног» — «ноги», «рук» — «руки»)
+    ("сколько стоит эпиляция ног", None),
+    ("сколько стоит эпиляция ног для мужчин", None),
+    ("цена эпиляции рук", None),
+    # Одинаково подходят услуги разных разделов или больше PRICE_MAX_OPTIONS вариантов
+    ("сколько стоит пилинг", None),
+    ("сколько стоит повторная", None),
+    ("hydrafacial цена", None),
+    ("цена ботокса", None),
+    ("сколько стоят услуги", None),
+    ("где вы находитесь", None),
+    ("какая цена", None),
+]
+
+if __name__ == "__main__":
+    index = CatalogIndex(services)
+    answered = correct = should_fall_through = fell_through = 0
+    elapsed = 0.0
+    for question, expected in LABELED:
+        started = time.perf_counter()
+        items = index.resolve_price(question) if has_price_intent(question) else []
+        elapsed += time.perf_counter() - started
+        if expected is None:
+            should_fall_through += 1
+            fell_through += not items
+        if items:
+            answered += 1
+            correct += expected is not None and all(expected in " > ".join(item.path) for item in items)
+        print(f"{'+' if items else '-'} {question:<50} {items[0].path[-1] if items else ''}")
+    print(f"answered {answered}/{len(LABELED)}, precision {correct / max(answered, 1):.2f}, "
+          f"fall-through {fell_through}/{should_fall_through}, "
+          f"{elapsed / len(LABELED) * 1e6:.0f} µs/question")
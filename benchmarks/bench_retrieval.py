@@ -0,0 +1,34 @@
+# Размер промпта с полным каталогом и с отбором разделов под вопрос.
+# Запуск из корня репозитория: python -m benchmarks.bench_retrieval
+import time
+
+from bot import CATALOG_INDEX, SYSTEM_PROMPTS
+from prompts import estimate_messages_tokens
+
+QUESTIONS = [
+    "сколько стоит лазерная эпиляция подмышек",
+    "цена ботокса",
+    "консультация гинеколога",
+    "сколько стоит чистка зубов",
+    "сколько стоят брекеты",
+    "удаление папиллом на шее",
+    "smas лифтинг лица цена",
+    "hydrafacial",
+    "плазмолифтинг волос",
+    "где вы находитесь",
+    "какие у вас есть услуги",
+    "массаж спины",
+]
+
+if __name__ == "__main__":
+    full_total = retrieved_total = 0
+    for question in QUESTIONS:
+        full = estimate_messages_tokens(SYSTEM_PROMPTS.build('ru', question))
+        started = time.perf_counter()
+        services_text = CATALOG_INDEX.relevant_text(question)
+        elapsed = time.perf_counter() - started
+        retrieved = estimate_messages_tokens(SYSTEM_PROMPTS.build('ru', question, services_text))
+        full_total += full
+        retrieved_total += retrieved
+        print(f"{question:<45} {full:>7} -> {retrieved:>6} tokens  ({elapsed * 1000:.2f} ms)")
+    print(f"{'average':<45} {full_total // len(QUESTIONS):>7} -> {retrieved_total // len(QUESTIONS):>6} tokens")
@@ -0,0 +1,42 @@
+# Пропускная способность планировщика обновлений и проверка порядка внутри чата.
+# Запуск из корня репозитория: python -m benchmarks.bench_scheduler
+import asyncio
+import random
+import time
+
+from updates import ChatScheduler
+
+CHATS = 50
+MESSAGES_PER_CHAT = 10
+# Имитация вызова OpenAI: от 20 до 80 мс
+HANDLER_LATENCY = (0.02, 0.08)
+
+async def run(concurrency):
+    seen = {}
+
+    async def process(item):
+        chat_id, seq = item
+        await asyncio.sleep(random.uniform(*HANDLER_LATENCY))
+        seen.setdefault(chat_id, []).append(seq)
+
+    scheduler = ChatScheduler(process, concurrency, CHATS * MESSAGES_PER_CHAT)
+    scheduler.start()
+    started = time.perf_counter()
+    # Сообщения чатов приходят вперемешку, как в реальном вебхуке
+    for seq in range(MESSAGES_PER_CHAT):
+        for chat_id in range(CHATS):
+            scheduler.submit(chat_id, (chat_id, seq))
+    await scheduler.stop(timeout=None)
+    elapsed = time.perf_counter() - started
+
+    ordered = all(seen[chat_id] == list(range(MESSAGES_PER_CHAT)) for chat_id in range(CHATS))
+    total = CHATS * MESSAGES_PER_CHAT
+    print(f"concurrency={concurrency:<4} {total / elapsed:8.1f} updates/s  ordered={ordered}")
+
+async def main():
+    random.seed(0)
+    for concurrency in (1, 4, 16, 64):
+        await run(concurrency)
+
+if __name__ == "__main__":
+    asyncio.run(main())
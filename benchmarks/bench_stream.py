@@ -0,0 +1,85 @@
+# Время до первого видимого текста: обычный запрос против потокового ответа.
+# OpenAI заменён локальным сервером, который выдаёт токены с задержкой.
+# Запуск из корня репозитория: python -m benchmarks.bench_stream
+import asyncio
+import json
+import time
+
+import openai
+from aiohttp import web
+
+import llm
+from streaming import StreamingReply
+
+PORT = 8765
+TOKENS = ["Лазерная", " эпиляция", " подмышек", " стоит", " 340 000", " сум", " для", " женщин", "."] * 8
+FIRST_TOKEN_DELAY = 0.3
+TOKEN_DELAY = 0.03
+
+# Локальная замена OpenAI: задержка до первого токена и равномерная генерация дальше
+async def completions(request):
+    body = await request.json()
+    await asyncio.sleep(FIRST_TOKEN_DELAY)
+    if not body.get('stream'):
+        await asyncio.sleep(TOKEN_DELAY * len(TOKENS))
+        return web.json_response({
+            "id": "local", "object": "chat.completion", "created": 0, "model": body['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(TOKENS)},
+                         "finish_reason": "stop"}],
+        })
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    for token in TOKENS:
+        chunk = {"id": "local", "object": "chat.completion.chunk", "created": 0, "model": body['model'],
+                 "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        await asyncio.sleep(TOKEN_DELAY)
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+# Сообщение Telegram, которое только запоминает моменты отправки и правок
+class LocalMessage:
+    def __init__(self):
+        self.events = []
+
+    async def reply_text(self, text):
+        self.events.append(time.monotonic())
+        return self
+
+    async def edit_text(self, text):
+        self.events.append(time.monotonic())
+        return self
+
+async def main():
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+    openai.api_base = f"http://127.0.0.1:{PORT}/v1"
+    openai.api_key = "local"
+    await llm.open_session(None)
+    messages = [{"role": "user", "content": "сколько стоит эпиляция"}]
+
+    message = LocalMessage()
+    started = time.monotonic()
+    response = await llm.chat_completion(model="gpt-4o", messages=messages)
+    await message.reply_text(response.choices[0].message['content'])
+    print(f"blocking:  first text after {message.events[0] - started:.3f} s, 1 message")
+
+    message = LocalMessage()
+    reply = StreamingReply(message, interval=0.5)
+    started = time.monotonic()
+    answer = ""
+    async for delta in llm.stream_chat_completion(model="gpt-4o", messages=messages):
+        answer += delta
+        await reply.update(answer)
+    await reply.finish(answer)
+    print(f"streaming: first text after {message.events[0] - started:.3f} s, "
+          f"done after {message.events[-1] - started:.3f} s, {len(message.events)} sends/edits")
+
+    await llm.close_session(None)
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
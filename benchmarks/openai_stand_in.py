@@ -0,0 +1,99 @@
+# Локальная замена точки доступа OpenAI для проверки пула точек (endpoints.py):
+# задержка ответа, доля ошибок 500 и заголовки x-ratelimit-* с заданным остатком квоты
+# (общим или своим для каждого ключа API).
+# Параметры можно менять на ходу — так точка «деградирует» посреди прогона.
+# Запуск отдельно: python -m benchmarks.openai_stand_in --port 9301 --delay 0.5 --error-rate 0.3
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+ANSWER = ["Лазерная", " эпиляция", " подмышек", " стоит", " 340 000", " сум", "."]
+
+class StandIn:
+    def __init__(self, port, delay=0.1, error_rate=0.0, rpm=500, tpm=30000, remaining=1.0, key_remaining=None):
+        self.port = port
+        self.delay = delay
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.tpm = tpm
+        # Доля квоты, которую точка сообщает в x-ratelimit-remaining-*
+        self.remaining = remaining
+        # Остаток квоты по ключам API: {ключ: доля}; для остальных ключей — remaining
+        self.key_remaining = key_remaining or {}
+        self.requests = 0
+        self.errors = 0
+        self.runner = None
+
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def headers(self, api_key=None):
+        remaining = self.key_remaining.get(api_key, self.remaining)
+        return {
+            'x-ratelimit-limit-requests': str(self.rpm),
+            'x-ratelimit-remaining-requests': str(int(self.rpm * remaining)),
+            'x-ratelimit-limit-tokens': str(self.tpm),
+            'x-ratelimit-remaining-tokens': str(int(self.tpm * remaining)),
+        }
+
+    async def completions(self, request):
+        body = await request.json()
+        headers = self.headers(request.headers.get('Authorization', '')[len('Bearer '):] or None)
+        self.requests += 1
+        await asyncio.sleep(self.delay * random.uniform(0.8, 1.2))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "stand-in failure", "type": "server_error"}},
+                                     status=500, headers=headers)
+        if not body.get('stream'):
+            return web.json_response({
+                "id": "local", "object": "chat.completion", "created": 0, "model": body['model'],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(ANSWER)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(ANSWER), "total_tokens": 100 + len(ANSWER)},
+            }, headers=headers)
+        response = web.StreamResponse(headers=dict(headers, **{'Content-Type': 'text/event-stream'}))
+        await response.prepare(request)
+        for token in ANSWER:
+            chunk = {"id": "local", "object": "chat.completion.chunk", "created": 0, "model": body['model'],
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            chunk = {"id": "local", "object": "chat.completion.chunk", "created": 0, "model": body['model'],
+                     "choices": [], "usage": {"prompt_tokens": 100, "completion_tokens": len(ANSWER),
+                                              "total_tokens": 100 + len(ANSWER),
+                                              "prompt_tokens_details": {"cached_tokens": 64}}}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.completions)
+        # Azure: /openai/deployments/{deployment}/chat/completions?api-version=...
+        app.router.add_post('/openai/deployments/{deployment}/chat/completions', self.completions)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+async def serve(stand_in):
+    await stand_in.start()
+    print(f"stand-in listening on {stand_in.url()}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=9301)
+    parser.add_argument('--delay', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--remaining', type=float, default=1.0, help="доля квоты в x-ratelimit-remaining-*")
+    args = parser.parse_args()
+    asyncio.run(serve(StandIn(args.port, args.delay, args.error_rate, remaining=args.remaining)))
@@ -1,11 +1,23 @@
+import asyncio
 import logging
 import os
-from flask import Flask, request, jsonify
-from telegram import Update, Bot
+import time
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
 import openai
-from datetime import datetime, timedelta
 from data import services
+from prompts import SystemPrompts, estimate_messages_tokens, estimate_tokens
+from catalog import CATALOG_TOP_K, CatalogIndex, has_price_intent
+from cache import ResponseCache, SemanticCache, SingleFlight
+from llm import chat_completion, stream_chat_completion
+from streaming import StreamingReply
+from memory import ConversationMemory, refers_back
+from usage import UsageLedger, cached_prompt_tokens
+from routing import RouteFeatures, choose_model
+from resilience import LLMGuard, UpstreamUnavailable
+from intents import SMALL_TALK, IntentClassifier
+from debounce import ChatDebouncer
+from tools import FUNCTIONS, FUNCTIONS_TOKENS, TOOL_CALLING, ToolBox, ToolCaller
 from dotenv import load_dotenv
 import requests
 
@@ -17,17 +29,20 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+logger = logging.getLogger(__name__)
 
 # Ваши API ключи из .env файла
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Показывать ответ OpenAI по мере генерации
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', '1') == '1'
 ZAPIER_WEBHOOK_URL = os.getenv('ZAPIER_WEBHOOK_URL')
+ZAPIER_TIMEOUT = float(os.getenv('ZAPIER_TIMEOUT', 10))
+# Соединений с Bot API: ответы и правки потоковых сообщений из всех воркеров идут параллельно
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv('TELEGRAM_CONNECTION_POOL_SIZE', 256))
 
 openai.api_key = OPENAI_API_KEY
 
-# Инициализация Flask приложения
-app = Flask(__name__)
-
 # Контактная информация клиники
 CONTACT_INFO = {
     "address": "Республика Узбекистан, город Ташкент, улица Аския 26Б",
@@ -77,6 +92,117 @@ WELCOME_MESSAGES = {
     "en": "I am the artificial intelligence of the Mediva clinic. My task is to provide information about the services and prices, help with making appointments, answer questions about services and procedures, and also provide other useful information about our clinic. How can I help you?"
 }
 
+# Ответ на вопрос о цене прямо из каталога
+PRICE_MESSAGES = {
+    "ru": "Стоимость по прайс-листу клиники Медива:",
+    "uz": "Mediva klinikasi narxlari:",
+    "en": "Prices at the Mediva clinic:"
+}
+# Ответ без OpenAI, пока он недоступен
+DEGRADED_MESSAGES = {
+    "ru": "Сейчас я не могу ответить подробно. Вот что есть в прайс-листе по вашему вопросу:",
+    "uz": "Hozir batafsil javob bera olmayman. Savolingiz bo'yicha narxlar ro'yxati:",
+    "en": "I can't give a detailed answer right now. Here is what the price list has on your question:"
+}
+DEGRADED_CONTACT_MESSAGES = {
+    "ru": "Сейчас я не могу ответить подробно. Пожалуйста, свяжитесь с клиникой:",
+    "uz": "Hozir batafsil javob bera olmayman. Iltimos, klinika bilan bog'laning:",
+    "en": "I can't give a detailed answer right now. Please contact the clinic:"
+}
+# Сколько услуг перечислять в таком ответе
+DEGRADED_MAX_ITEMS = int(os.getenv('DEGRADED_MAX_ITEMS', 10))
+# Ответы на приветствие, благодарность и прощание без OpenAI
+SMALL_TALK_REPLIES = {
+    "greeting": {
+        "ru": "Здравствуйте! Чем могу помочь?",
+        "uz": "Assalomu alaykum! Sizga qanday yordam bera olaman?",
+        "en": "Hello! How can I help you?"
+    },
+    "thanks": {
+        "ru": "Пожалуйста! Если появятся вопросы — пишите.",
+        "uz": "Arzimaydi! Savollaringiz bo'lsa, yozing.",
+        "en": "You're welcome! Feel free to ask if you have any questions."
+    },
+    "goodbye": {
+        "ru": "До свидания! Будем рады видеть вас в клинике Медива.",
+        "uz": "Xayr! Sizni Mediva klinikasida kutib qolamiz.",
+        "en": "Goodbye! We look forward to seeing you at the Mediva clinic."
+    }
+}
+BOOKING_HINTS = {
+    "ru": "Записаться на приём можно по телефону",
+    "uz": "Qabulga telefon orqali yozilishingiz mumkin",
+    "en": "You can book an appointment by phone"
+}
+# Рекомендация врачей и справочная информация
+DOCTORS_MESSAGES = {
+    "ru": "Вот рекомендуемые врачи по вашему запросу:",
+    "uz": "So'rovingiz bo'yicha tavsiya etilgan shifokorlar:",
+    "en": "Here are the doctors we recommend for your request:"
+}
+# Начала слов, по которым выбирается специальность врача
+DOCTOR_KEYWORDS = {
+    "dermatologists": ("дерматолог", "косметолог", "кож", "dermatolog", "kosmetolog", "teri", "cosmetolog", "skin"),
+    "dentists": ("стоматолог", "зуб", "stomatolog", "tish", "dentist", "tooth", "teeth")
+}
+CONTACT_LABELS = {
+    "ru": {"address": "Адрес", "phone": "Номер телефона", "email": "Email", "website": "Ссылка на официальный сайт"},
+    "uz": {"address": "Manzil", "phone": "Telefon raqami", "email": "Email", "website": "Rasmiy sayt"},
+    "en": {"address": "Address", "phone": "Phone number", "email": "Email", "website": "Official website"}
+}
+# Запись на приём: запрос данных, подсказка формата, подтверждение и ошибка
+BOOKING_PROMPTS = {
+    "ru": "Укажите через запятую Ваше И.Ф.О, полную дату рождения и удобное время для записи.",
+    "uz": "Qabulga yozilish uchun F.I.Sh., to'liq tug'ilgan sanangiz va qulay vaqtni vergul bilan ajratib yozing.",
+    "en": "Please send your full name, full date of birth and preferred appointment time, separated by commas."
+}
+BOOKING_FORMAT_HINTS = {
+    "ru": "Пожалуйста, предоставьте всю информацию в формате: И.Ф.О, дата рождения, удобное время.",
+    "uz": "Iltimos, ma'lumotlarni quyidagi formatda yuboring: F.I.Sh., tug'ilgan sana, qulay vaqt.",
+    "en": "Please send all the details in this format: full name, date of birth, preferred time."
+}
+BOOKING_CONFIRMATIONS = {
+    "ru": "{name}, благодарим за ваше обращение.\n\nМы записали вас на прием.\n\nДата рождения: {dob}\nВремя: {time}\n\n"
+          "Если у вас возникнут дополнительные вопросы или изменения, пожалуйста, сообщите нам по номеру {phone}.\n\n"
+          "Хорошего дня!",
+    "uz": "{name}, murojaatingiz uchun rahmat.\n\nSiz qabulga yozildingiz.\n\nTug'ilgan sana: {dob}\nVaqt: {time}\n\n"
+          "Qo'shimcha savollar yoki o'zgarishlar bo'lsa, iltimos, {phone} raqami orqali bizga xabar bering.\n\n"
+          "Kuningiz xayrli o'tsin!",
+    "en": "{name}, thank you for contacting us.\n\nYou are booked for an appointment.\n\nDate of birth: {dob}\nTime: {time}\n\n"
+          "If you have any questions or changes, please let us know at {phone}.\n\n"
+          "Have a nice day!"
+}
+BOOKING_FAILURES = {
+    "ru": "Извините, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз позже "
+          "или позвоните нам: {phone}",
+    "uz": "Kechirasiz, so'rovingizni qayta ishlashda xatolik yuz berdi. Iltimos, keyinroq qayta urinib ko'ring "
+          "yoki bizga qo'ng'iroq qiling: {phone}",
+    "en": "Sorry, something went wrong while processing your request. Please try again later or call us: {phone}"
+}
+
+# Системные сообщения для OpenAI и поисковый индекс каталога, собираются один раз при запуске
+SYSTEM_PROMPTS = SystemPrompts(LANGUAGES)
+SYSTEM_PROMPTS.rebuild(services, CONTACT_INFO, DOCTORS)
+CATALOG_INDEX = CatalogIndex(services)
+# Кэш ответов OpenAI на часто повторяющиеся вопросы
+RESPONSE_CACHE = ResponseCache()
+# Кэш ответов на похожие по смыслу вопросы, сохраняется на диск между перезапусками
+SEMANTIC_CACHE = SemanticCache()
+# Одинаковые вопросы, заданные одновременно, обслуживает один запрос к OpenAI
+SINGLE_FLIGHT = SingleFlight()
+# Последние реплики каждого чата для уточняющих вопросов
+MEMORY = ConversationMemory()
+# Учёт токенов и стоимости вызовов OpenAI
+USAGE = UsageLedger()
+# Срок ответа, дублирующие запросы и автомат защиты для вызовов OpenAI
+LLM_GUARD = LLMGuard()
+# Определение типа сообщения без OpenAI
+INTENT_CLASSIFIER = IntentClassifier()
+# Функции с данными клиники для режима TOOL_CALLING
+TOOL_CALLER = ToolCaller(ToolBox(CATALOG_INDEX, CONTACT_INFO, DOCTORS))
+# Сообщения, отправленные пациентом подряд, получают один общий ответ
+DEBOUNCER = ChatDebouncer()
+
 # Стартовая команда
 async def start(update: Update, context: CallbackContext) -> None:
     await update.message.reply_text('Выберите язык / Choose a language:', 
@@ -93,136 +219,314 @@ async def set_language(update: Update, context: CallbackContext) -> None:
         context.user_data['language'] = 'en'
     await update.message.reply_text(WELCOME_MESSAGES[context.user_data['language']])
 
-# Преобразование словаря услуг в текст
-def services_to_text(services):
-    service_text = ""
-    for category, items in services.items():
-        if isinstance(items, dict):
-            service_text += f"{category}:\n"
-            for service, price in items.items():
-                service_text += f"  {service}: {price}\n"
-        else:
-            service_text += f"{category}: {items}\n"
-    return service_text
-
 # Функция для рекомендации врачей
-async def recommend_doctors(update: Update, context: CallbackContext) -> None:
-    user_language = context.user_data.get('language', 'ru')
+async def recommend_doctors(update: Update, context: CallbackContext, user_language=None) -> None:
+    user_language = user_language or context.user_data.get('language', 'ru')
     user_input = update.message.text.lower()
 
-    if "дерматолог" in user_input or "косметолог" in user_input:
-        doctors = DOCTORS["recommended"]["dermatologists"]
-    elif "стоматолог" in user_input:
-        doctors = DOCTORS["recommended"]["dentists"]
-    else:
-        doctors = DOCTORS["recommended"]["dermatologists"] + DOCTORS["recommended"]["dentists"]
+    specialties = [specialty for specialty, keywords in DOCTOR_KEYWORDS.items()
+                   if any(keyword in user_input for keyword in keywords)]
+    if len(specialties) != 1:
+        specialties = list(DOCTOR_KEYWORDS)
+    doctors = [doctor for specialty in specialties for doctor in DOCTORS["recommended"][specialty]]
 
-    response = f"Вот рекомендуемые врачи по вашему запросу:\n" + "\n".join(doctors)
+    response = f"{DOCTORS_MESSAGES[user_language]}\n" + "\n".join(doctors)
     await update.message.reply_text(response)
 
+# Ответ с ценами найденных услуг
+def format_price_answer(user_language, items):
+    lines = [PRICE_MESSAGES[user_language]]
+    lines.extend(f"• {' > '.join(item.path)}: {item.price}" for item in items)
+    lines.append("")
+    lines.append(f"{BOOKING_HINTS[user_language]}: {CONTACT_INFO['phone']}")
+    return "\n".join(lines)
+
+# Уточняющий вопрос: без предыдущей реплики непонятен. Он ссылается на неё («а для
+# мужчин?», «это больно?»), не называет ни одной услуги каталога или спрашивает цену,
+# которую каталог без уточнения не определяет однозначно («сколько стоит повторная?»).
+# Остальные вопросы, даже в середине диалога, самостоятельны: их ответы общие для всех
+# пациентов и берутся из кэшей.
+def is_follow_up(user_input, chat_id, intent):
+    if chat_id is None or not MEMORY.has_history(chat_id):
+        return False
+    if refers_back(user_input) or not CATALOG_INDEX.top_sections(user_input, 1):
+        return True
+    return intent == 'price' and not CATALOG_INDEX.resolve_price(user_input)
+
+# Ответ, пока OpenAI недоступен: услуги лучшего раздела каталога и контакты клиники
+def degraded_answer(user_language, user_input, chat_id=None):
+    intent = 'price' if has_price_intent(user_input) else 'question'
+    if is_follow_up(user_input, chat_id, intent):
+        user_input = f"{MEMORY.last_question(chat_id)} {user_input}"
+    sections = CATALOG_INDEX.top_sections(user_input, 1)
+    items = [item for item in CATALOG_INDEX.sections[sections[0][0]] if item.price is not None] if sections else []
+    if items:
+        lines = [DEGRADED_MESSAGES[user_language]]
+        lines.extend(f"• {' > '.join(item.path)}: {item.price}" for item in items[:DEGRADED_MAX_ITEMS])
+    else:
+        lines = [DEGRADED_CONTACT_MESSAGES[user_language]]
+    lines.append("")
+    lines.append(f"{BOOKING_HINTS[user_language]}: {CONTACT_INFO['phone']}")
+    lines.append(f"{CONTACT_INFO['address']}, {CONTACT_INFO['website']}")
+    return "\n".join(lines)
+
+# Ответ на вопрос пациента: из каталога, из кэша или от OpenAI.
+# reply — StreamingReply, в который по мере генерации передаётся текст ответа OpenAI;
+# chat_id — чат, история которого подставляется в промпт и пополняется ответом.
+async def answer_question(user_language, user_input, reply=None, chat_id=None):
+    try:
+        answer = await find_answer(user_language, user_input, reply, chat_id)
+    except UpstreamUnavailable as error:
+        logger.warning("Ответ без OpenAI: %s", error)
+        return degraded_answer(user_language, user_input, chat_id)
+    except openai.error.InvalidRequestError as error:
+        # Например, слишком длинное сообщение: OpenAI его не примет, но пациент получит ответ из каталога
+        logger.error("OpenAI отклонил запрос: %s", error)
+        return degraded_answer(user_language, user_input, chat_id)
+    if chat_id is not None:
+        MEMORY.add(chat_id, user_input, answer)
+    return answer
+
+# Ответ без OpenAI: цена из каталога или ответ из кэшей; None, если нужен запрос к OpenAI
+def local_answer(user_language, user_input, chat_id=None):
+    intent = 'price' if has_price_intent(user_input) else 'question'
+    follow_up = is_follow_up(user_input, chat_id, intent)
+
+    # Прямые вопросы о цене, на которые каталог отвечает однозначно, не требуют OpenAI.
+    # Уточняющий вопрос («а сколько стоит повторная?») понимается в контексте предыдущего.
+    if intent == 'price':
+        items = CATALOG_INDEX.resolve_price(user_input, MEMORY.last_question(chat_id) if follow_up else None)
+        if items:
+            return format_price_answer(user_language, items)
+    # Ответ на уточняющий вопрос зависит от предыдущих реплик, поэтому общие кэши здесь не подходят
+    if follow_up:
+        return None
+
+    cache_key = RESPONSE_CACHE.key(user_language, user_input)
+    answer = RESPONSE_CACHE.get(cache_key, SYSTEM_PROMPTS.version)
+    if answer is not None:
+        return answer
+    answer = SEMANTIC_CACHE.get(user_language, user_input, SYSTEM_PROMPTS.version, CATALOG_INDEX.topic(user_input))
+    if answer is not None:
+        RESPONSE_CACHE.put(cache_key, answer, 0.0, SYSTEM_PROMPTS.version)
+    return answer
+
+async def find_answer(user_language, user_input, reply, chat_id):
+    answer = local_answer(user_language, user_input, chat_id)
+    if answer is not None:
+        return answer
+
+    intent = 'price' if has_price_intent(user_input) else 'question'
+    progress = reply.update if reply is not None else None
+    if is_follow_up(user_input, chat_id, intent):
+        search_query = f"{MEMORY.last_question(chat_id)} {user_input}"
+        return await request_answer(user_language, user_input, intent, search_query, None, progress, chat_id)
+
+    # Поток общего ответа показывается в чатах всех, кто его ждёт
+    cache_key = RESPONSE_CACHE.key(user_language, user_input)
+    return await SINGLE_FLIGHT.do(
+        cache_key,
+        lambda shared: request_answer(user_language, user_input, intent, user_input, cache_key, shared, chat_id),
+        progress,
+    )
+
+# Признаки вопроса для выбора модели и сообщения для запроса
+def routing_features(user_language, user_input, search_query=None, chat_id=None, intent=None):
+    if intent is None:
+        intent = 'price' if has_price_intent(user_input) else 'question'
+    sections = CATALOG_INDEX.top_sections(search_query or user_input)
+    history = MEMORY.messages(chat_id) if chat_id is not None else []
+    features = RouteFeatures(
+        tokens=estimate_tokens(user_input),
+        intent=intent,
+        catalog_score=sections[0][1] if sections else 0.0,
+        history_turns=MEMORY.depth(chat_id) if chat_id is not None else 0,
+    )
+    # CATALOG_TOP_K=0 — каталог отправляется целиком, разделы нужны только для оценки
+    services_text = CATALOG_INDEX.sections_text(sections) if CATALOG_TOP_K > 0 else None
+    messages = SYSTEM_PROMPTS.build(user_language, user_input, services_text, history)
+    return features, messages
+
+# Запрос ответа у OpenAI. Ответ на самостоятельный вопрос (cache_key) общий для всех
+# пациентов: он сохраняется в кэши, и история чата в его промпт не входит.
+# progress(text) получает текст ответа по мере генерации.
+async def request_answer(user_language, user_input, intent, search_query, cache_key, progress, chat_id=None):
+    started = time.monotonic()
+    history_chat_id = chat_id if cache_key is None else None
+    features, messages = routing_features(user_language, user_input, search_query, history_chat_id, intent)
+    model = choose_model(features)
+    estimated_prompt_tokens = estimate_messages_tokens(messages)
+    if TOOL_CALLING:
+        history = MEMORY.messages(history_chat_id) if history_chat_id is not None else []
+        answer = await answer_with_tools(user_language, user_input, intent, model, chat_id, started, history)
+    elif progress is not None and STREAM_REPLIES:
+        answer = ""
+        usage = {}
+        async for delta in LLM_GUARD.stream(lambda: stream_chat_completion(
+                chat_id, estimated_prompt_tokens, usage, model=model, messages=messages)):
+            answer += delta
+            await progress(answer)
+        answer = answer.strip()
+        if usage:
+            USAGE.record(model, user_language, intent, estimated_prompt_tokens, usage['prompt_tokens'],
+                         usage['completion_tokens'], time.monotonic() - started,
+                         cached_tokens=cached_prompt_tokens(usage))
+        else:
+            # Точка не прислала usage в конце потока — используем локальную оценку
+            USAGE.record(model, user_language, intent, estimated_prompt_tokens, estimated_prompt_tokens,
+                         estimate_tokens(answer), time.monotonic() - started, estimated=True)
+    else:
+        response = await LLM_GUARD.call(lambda: chat_completion(
+            chat_id, estimated_prompt_tokens, model=model, messages=messages))
+        answer = response.choices[0].message['content'].strip()
+        USAGE.record(model, user_language, intent, estimated_prompt_tokens, response.usage.prompt_tokens,
+                     response.usage.completion_tokens, time.monotonic() - started,
+                     cached_tokens=cached_prompt_tokens(response.usage))
+    if cache_key is not None:
+        RESPONSE_CACHE.put(cache_key, answer, time.monotonic() - started, SYSTEM_PROMPTS.version)
+        SEMANTIC_CACHE.put(user_language, user_input, answer, SYSTEM_PROMPTS.version, CATALOG_INDEX.topic(user_input))
+    return answer
+
+# Ответ в режиме вызова функций: вместо каталога в промпте модель получает описания
+# функций и запрашивает только нужные данные. Ответ не передаётся потоком.
+async def answer_with_tools(user_language, user_input, intent, model, chat_id, started, history):
+    messages = SYSTEM_PROMPTS.build_for_tools(user_language, user_input, history)
+    # С чем сравнивать: тот же вопрос с полным каталогом в промпте
+    baseline_tokens = estimate_messages_tokens(SYSTEM_PROMPTS.build(user_language, user_input, None, history))
+
+    async def complete(messages, function_call):
+        # Все запросы одного вопроса укладываются в общий срок LLM_GUARD
+        return await LLM_GUARD.call(lambda: chat_completion(
+            chat_id, estimate_messages_tokens(messages) + FUNCTIONS_TOKENS, model=model, messages=messages,
+            functions=FUNCTIONS, function_call=function_call), deadline=started + LLM_GUARD.deadline - time.monotonic())
+
+    answer, (estimated_prompt_tokens, prompt_tokens, completion_tokens, cached_tokens) = \
+        await TOOL_CALLER.run(complete, messages, baseline_tokens)
+    USAGE.record(model, user_language, intent, estimated_prompt_tokens, prompt_tokens, completion_tokens,
+                 time.monotonic() - started, cached_tokens=cached_tokens)
+    return answer
+
 # Обработка сообщений
 async def handle_message(update: Update, context: CallbackContext) -> None:
+    # Пока идёт запись на приём, сообщение сначала считается данными для записи
+    if await handle_appointment(update, context):
+        return
     user_input = update.message.text.lower()
-    user_language = context.user_data.get('language', 'ru')
-
-    if "врач" in user_input or "доктор" in user_input:
-        await recommend_doctors(update, context)
-    else:
-        services_text = services_to_text(services)
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant for a medical clinic. Respond in {LANGUAGES[user_language]}."},
-                {"role": "system", "content": f"Here is the list of services and their prices:\n{services_text}"},
-                {"role": "system", "content": f"Here is the contact information:\n{CONTACT_INFO}"},
-                {"role": "system", "content": f"Here is the information about doctors:\n{DOCTORS}"},
-                {"role": "user", "content": user_input}
-            ]
+    intent = INTENT_CLASSIFIER.classify(user_input)
+    # Пока язык не выбран, отвечаем на языке сообщения
+    user_language = context.user_data.get('language') or intent.language or 'ru'
+
+    if intent.name == 'doctors':
+        await recommend_doctors(update, context, user_language)
+    elif intent.name == 'contacts':
+        await provide_info(update, context, user_language)
+    elif intent.name == 'booking':
+        await book_appointment(update, context, user_language)
+    elif intent.name in SMALL_TALK:
+        await update.message.reply_text(SMALL_TALK_REPLIES[intent.name][user_language])
+    elif DEBOUNCER.window > 0:
+        chat_id = update.effective_chat.id
+        # Ответ из каталога или кэша готов сразу, продолжения ждём только перед запросом к OpenAI.
+        # Сообщение чата, который уже ждёт ответа, присоединяется к ожидающим.
+        answer = None if DEBOUNCER.waiting(chat_id) else local_answer(user_language, user_input, chat_id)
+        if answer is not None:
+            MEMORY.add(chat_id, user_input, answer)
+            await update.message.reply_text(answer)
+            return
+        DEBOUNCER.submit(
+            chat_id, user_input,
+            lambda text, pending: reply_to_question(update, user_language, text, pending),
+            lambda coroutine: context.application.create_task(coroutine, update=update),
         )
-        await update.message.reply_text(response.choices[0].message['content'].strip())
+    else:
+        reply = StreamingReply(update.message)
+        await reply.finish(await answer_question(user_language, user_input, reply, update.effective_chat.id))
 
-# Функция для отправки данных в Zapier
+# Ответ на накопленные сообщения чата; при повторном запросе правится уже показанный ответ
+async def reply_to_question(update: Update, user_language, text, pending) -> None:
+    if pending.reply is None:
+        pending.reply = StreamingReply(update.message)
+    await pending.reply.finish(await answer_question(user_language, text, pending.reply, update.effective_chat.id))
+
+# Функция для отправки данных в Zapier; блокирующий запрос, вызывается в отдельном потоке
 def send_to_zapier(data):
-    response = requests.post(ZAPIER_WEBHOOK_URL, json=data)
+    if not ZAPIER_WEBHOOK_URL:
+        logger.error("ZAPIER_WEBHOOK_URL не задан, запись на приём не отправлена")
+        return False
+    try:
+        response = requests.post(ZAPIER_WEBHOOK_URL, json=data, timeout=ZAPIER_TIMEOUT)
+    except requests.RequestException as error:
+        logger.error("Zapier недоступен: %s", error)
+        return False
     return response.status_code == 200
 
-# Запись на прием
-async def book_appointment(update: Update, context: CallbackContext) -> None:
-    user_language = context.user_data.get('language', 'ru')
-    await update.message.reply_text(f"Укажите Ваше И.Ф.О, полную дату рождения и удобное время для записи ({LANGUAGES[user_language]}).")
-
-# Обработчик записи данных для записи на прием
-async def handle_appointment(update: Update, context: CallbackContext) -> None:
-    user_data = update.message.text.split(',')
-    if len(user_data) == 3:
-        fio, dob, time = user_data
-        appointment_data = {
-            "fio": fio.strip(),
-            "dob": dob.strip(),
-            "time": time.strip(),
-            "platform": "Telegram"
-        }
-        if send_to_zapier(appointment_data):
-            await update.message.reply_text(
-                f"{fio}, благодарим за ваше обращение.\n\n"
-                f"Мы записали вас на прием.\n\n"
-                f"Дата: {datetime.strptime(dob.strip(), '%Y-%m-%d').date()}\n"
-                f"Время: {time.strip()}\n\n"
-                f"Если у вас возникнут дополнительные вопросы или изменения, пожалуйста, сообщите нам по номеру {CONTACT_INFO['phone']}.\n\n"
-                f"Хорошего дня!"
-            )
-        else:
-            await update.message.reply_text("Извините, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз позже.")
+# Запись на прием: следующее сообщение пациента ждём как данные для записи
+async def book_appointment(update: Update, context: CallbackContext, user_language=None) -> None:
+    user_language = user_language or context.user_data.get('language', 'ru')
+    context.user_data['booking'] = {"language": user_language, "hinted": False}
+    await update.message.reply_text(BOOKING_PROMPTS[user_language])
+
+# Обработчик данных для записи на прием. Возвращает False, если записи нет и сообщение
+# нужно обработать как обычно. На сообщение не в формате один раз отвечает подсказкой,
+# после второго запись отменяется: пациент, скорее всего, спрашивает уже о другом.
+async def handle_appointment(update: Update, context: CallbackContext) -> bool:
+    booking = context.user_data.get('booking')
+    if booking is None:
+        return False
+    user_language = booking['language']
+    user_data = [part.strip() for part in update.message.text.split(',')]
+    if len(user_data) != 3 or not all(user_data):
+        if booking['hinted']:
+            del context.user_data['booking']
+            return False
+        booking['hinted'] = True
+        await update.message.reply_text(BOOKING_FORMAT_HINTS[user_language])
+        return True
+
+    del context.user_data['booking']
+    fio, dob, preferred_time = user_data
+    appointment_data = {
+        "fio": fio,
+        "dob": dob,
+        "time": preferred_time,
+        "platform": "Telegram"
+    }
+    if await asyncio.to_thread(send_to_zapier, appointment_data):
+        await update.message.reply_text(BOOKING_CONFIRMATIONS[user_language].format(
+            name=fio, dob=dob, time=preferred_time, phone=CONTACT_INFO['phone']))
     else:
-        await update.message.reply_text(f"Пожалуйста, предоставьте всю информацию в формате: И.Ф.О, дата рождения, удобное время. ({LANGUAGES[context.user_data['language']]})")
+        await update.message.reply_text(BOOKING_FAILURES[user_language].format(phone=CONTACT_INFO['phone']))
+    return True
 
 # Справочная информация
-async def provide_info(update: Update, context: CallbackContext) -> None:
-    user_language = context.user_data.get('language', 'ru')
-    contact_info = (
-        f"Адрес: {CONTACT_INFO['address']}\n"
-        f"Номер телефона: {CONTACT_INFO['phone']}\n"
-        f"Email: {CONTACT_INFO['email']}\n"
-        f"Ссылка на официальный сайт: {CONTACT_INFO['website']}"
-    )
-    await update.message.reply_text(f"{contact_info} ({LANGUAGES[user_language]})")
-
-# Обработчик вебхука
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    update = Update.de_json(request.get_json(force=True), bot)
-    application.process_update(update)
-    return jsonify({"ok": True})
-
-# Маршрут для проверки работоспособности
-@app.route('/')
-def index():
-    return 'Бот клиники Медива работает!'
-
-# Запуск бота
-def main() -> None:
-    global application
-    global bot
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    bot = application.bot
+async def provide_info(update: Update, context: CallbackContext, user_language=None) -> None:
+    user_language = user_language or context.user_data.get('language', 'ru')
+    labels = CONTACT_LABELS[user_language]
+    contact_info = "\n".join(f"{labels[key]}: {CONTACT_INFO[key]}" for key in ("address", "phone", "email", "website"))
+    await update.message.reply_text(contact_info)
+
+# Сборка приложения Telegram с обработчиками; request_class — транспорт Bot API вместо HTTPXRequest
+def build_application(request_class=None) -> Application:
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN).updater(None)
+    if request_class is not None:
+        builder = builder.request(request_class(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE))
+    else:
+        builder = builder.connection_pool_size(TELEGRAM_CONNECTION_POOL_SIZE)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(MessageHandler(filters.Regex('^(Русский|Uzbek|English)$'), set_language))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(CommandHandler("book", book_appointment))
     application.add_handler(CommandHandler("info", provide_info))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_appointment))
-
-if __name__ == "__main__":
-    main()
-    # Запуск Flask приложения
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port)
-
-
-
-
-
+    return application
 
+# Запуск бота
+def main() -> None:
+    import uvicorn
 
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run("webhook:app", host='0.0.0.0', port=port)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog import STOP_WORDS, normalize
+
+# Настройки кэша ответов OpenAI
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 5000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 24 * 60 * 60))
+
+# Настройки семантического кэша
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 2000))
+SEMANTIC_CACHE_DIM = int(os.getenv('SEMANTIC_CACHE_DIM', 1024))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', 'semantic_cache.npz')
+
+logger = logging.getLogger(__name__)
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+
+# Нормализация вопроса для ключа кэша: регистр, ё, пунктуация, пробелы и служебные слова.
+# «Сколько стоит лазерная эпиляция подмышек?» и «лазерная  эпиляция подмышек» дают один ключ.
+def normalize_question(text):
+    words = PUNCTUATION_RE.sub(' ', normalize(text)).split()
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+# Кэш ответов по (язык, нормализованный вопрос) с вытеснением LRU, сроком жизни
+# и ограничением памяти. Ответы зависят от каталога, контактов и врачей, поэтому
+# кэш очищается, как только меняется их версия (SystemPrompts.version).
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def key(self, language, text):
+        return language, normalize_question(text)
+
+    @staticmethod
+    def entry_size(key, answer):
+        return len(key[1].encode('utf-8')) + len(answer.encode('utf-8'))
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def _remove(self, key):
+        answer, _, _ = self.entries.pop(key)
+        self.size -= self.entry_size(key, answer)
+
+    def get(self, key, version):
+        self._check_version(version)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        answer, expires, latency = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += latency
+        return answer
+
+    # latency — сколько занял исходный запрос к OpenAI; нужна для счётчика сэкономленного времени
+    def put(self, key, answer, latency, version):
+        self._check_version(version)
+        if not key[1]:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (answer, time.monotonic() + self.ttl, latency)
+        self.size += self.entry_size(key, answer)
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+# Вектор вопроса: символьные 3- и 4-граммы нормализованного текста, разложенные
+# по dim корзинам хешем (hashing trick) со случайным знаком, с нормой 1.
+# Не требует словаря и обучения, устойчив к падежам и опечаткам.
+def embed_question(text, dim=SEMANTIC_CACHE_DIM):
+    vector = np.zeros(dim, dtype=np.float32)
+    padded = f" {normalize_question(text)} "
+    for n in (3, 4):
+        for i in range(len(padded) - n + 1):
+            digest = zlib.crc32(padded[i:i + n].encode('utf-8'))
+            vector[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+# Семантический кэш ответов: близкие по смыслу формулировки находят сохранённый ответ.
+# Векторы вопросов лежат строками одной матрицы, поиск — одно умножение матрицы
+# на вектор (косинус, так как векторы нормированы) и выбор лучшей строки выше порога.
+# Похожие формулировки о разных услугах («эпиляция ног» и «эпиляция рук», «для женщин»
+# и «для мужчин») близки по триграммам, поэтому ответ подходит, только если совпадает
+# и topic — услуга каталога, о которой вопрос (CatalogIndex.topic).
+# При переполнении вытесняется строка, которая дольше всех не использовалась.
+class SemanticCache:
+    def __init__(self, capacity=SEMANTIC_CACHE_SIZE, dim=SEMANTIC_CACHE_DIM,
+                 threshold=SEMANTIC_CACHE_THRESHOLD, path=SEMANTIC_CACHE_PATH):
+        self.capacity = capacity
+        self.dim = dim
+        self.threshold = threshold
+        self.path = path
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.matrix = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        self.languages = np.full(self.capacity, '', dtype='<U8')
+        self.topics = np.full(self.capacity, -1, dtype=np.int32)
+        self.answers = [None] * self.capacity
+        self.last_used = np.zeros(self.capacity, dtype=np.int64)
+        self.count = 0
+        self.clock = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def _touch(self, row):
+        self.clock += 1
+        self.last_used[row] = self.clock
+
+    def get(self, language, text, version, topic=-1):
+        self._check_version(version)
+        if not self.count:
+            self.misses += 1
+            return None
+        similarities = self.matrix[:self.count] @ embed_question(text, self.dim)
+        similarities[(self.languages[:self.count] != language) | (self.topics[:self.count] != topic)] = -1.0
+        row = int(np.argmax(similarities))
+        if similarities[row] <= self.threshold:
+            self.misses += 1
+            return None
+        self._touch(row)
+        self.hits += 1
+        return self.answers[row]
+
+    def put(self, language, text, answer, version, topic=-1):
+        self._check_version(version)
+        if self.count < self.capacity:
+            row = self.count
+            self.count += 1
+        else:
+            row = int(np.argmin(self.last_used))
+        self.matrix[row] = embed_question(text, self.dim)
+        self.languages[row] = language
+        self.topics[row] = topic
+        self.answers[row] = answer
+        self._touch(row)
+
+    # Сохранение матрицы на диск, чтобы кэш пережил перезапуск
+    def save(self):
+        if not self.path or not self.count:
+            return
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            matrix=self.matrix[:self.count],
+            languages=self.languages[:self.count],
+            topics=self.topics[:self.count],
+            answers=np.array(self.answers[:self.count], dtype=str),
+            last_used=self.last_used[:self.count],
+            version=np.array(self.version or ''),
+        )
+        os.replace(tmp_path, self.path)
+
+    # Загрузка сохранённого кэша; сохранённый для другой версии каталога отбрасывается
+    def load(self, version):
+        self._check_version(version)
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                # Файл без topics сохранён до проверки услуги — его ответы могли совпасть по ошибке
+                if str(saved['version']) != (version or '') or saved['matrix'].shape[1] != self.dim \
+                        or 'topics' not in saved.files:
+                    return
+                count = min(len(saved['matrix']), self.capacity)
+                self.matrix[:count] = saved['matrix'][:count]
+                self.languages[:count] = saved['languages'][:count]
+                self.topics[:count] = saved['topics'][:count]
+                self.answers[:count] = [str(answer) for answer in saved['answers'][:count]]
+                self.last_used[:count] = saved['last_used'][:count]
+        except (OSError, ValueError, KeyError):
+            logger.exception("Не удалось загрузить семантический кэш из %s", self.path)
+            return
+        self.count = count
+        self.clock = int(self.last_used[:count].max()) if count else 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Общий запрос single-flight: задача, число ожидающих и их слушатели промежуточных результатов
+class SharedCall:
+    __slots__ = ('task', 'waiters', 'listeners')
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.listeners = []
+
+    # Промежуточный результат (текст ответа по мере генерации) — всем, кто ждёт сейчас.
+    # Слушатель, который упал, больше не вызывается, но общий запрос продолжается.
+    async def progress(self, value):
+        listeners = list(self.listeners)
+        results = await asyncio.gather(*(listener(value) for listener in listeners), return_exceptions=True)
+        for listener, result in zip(listeners, results):
+            if isinstance(result, Exception):
+                logger.warning("Слушатель общего запроса упал: %r", result)
+                if listener in self.listeners:
+                    self.listeners.remove(listener)
+
+# Объединение одинаковых одновременных запросов (single-flight): пока запрос с ключом
+# выполняется, повторные вызовы с тем же ключом не запускают новый, а ждут его результат.
+# Общий запрос идёт в отдельной задаче: отмена одного из ожидающих не прерывает его
+# для остальных, а отменяется он, только когда ждать результата больше некому.
+# func(progress) получает функцию для промежуточных результатов: они уходят слушателям
+# (listener) всех ожидающих, а ожидающий, который ушёл, сразу перестаёт их получать.
+# Ошибка общего запроса получают все ожидающие, и следующий вызов запускает запрос заново.
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.started = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    async def do(self, key, func, listener=None):
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = SharedCall()
+            call.task = asyncio.ensure_future(func(call.progress))
+            call.task.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        task = call.task
+        call.waiters += 1
+        if listener is not None:
+            call.listeners.append(listener)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and call.waiters == 1:
+                task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+            if listener in call.listeners:
+                call.listeners.remove(listener)
+
+    def _finish(self, key, task):
+        call = self.calls.get(key)
+        if call is not None and call.task is task:
+            del self.calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "upstream_calls": self.started,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
@@ -0,0 +1,227 @@
+import math
+import os
+import re
+from collections import defaultdict, namedtuple
+
+# Сколько разделов каталога отправлять в OpenAI; 0 — отправлять каталог целиком
+CATALOG_TOP_K = int(os.getenv('CATALOG_TOP_K', 4))
+# Разделы с оценкой ниже этой доли от лучшего результата не отправляются
+CATALOG_MIN_RELATIVE_SCORE = float(os.getenv('CATALOG_MIN_RELATIVE_SCORE', 0.35))
+# Оценка, ниже которой совпадение считается случайным (общие триграммы)
+CATALOG_MIN_SCORE = float(os.getenv('CATALOG_MIN_SCORE', 8))
+# Прямой ответ на вопрос о цене: какая доля термов вопроса должна найтись в услуге
+PRICE_MIN_COVERAGE = float(os.getenv('PRICE_MIN_COVERAGE', 0.7))
+# Сколько почти равных по оценке услуг можно перечислить в одном ответе
+PRICE_MAX_OPTIONS = int(os.getenv('PRICE_MAX_OPTIONS', 3))
+# Уточняющий вопрос: какую долю от лучшего покрытия предыдущего вопроса должна набрать
+# найденная услуга, чтобы считаться связанной с ним
+PRICE_MIN_CONTEXT_COVERAGE = float(os.getenv('PRICE_MIN_CONTEXT_COVERAGE', 0.5))
+
+# Услуга каталога: путь от категории до названия и цена (None для заголовков без цены)
+CatalogItem = namedtuple('CatalogItem', ['path', 'price'])
+
+WORD_RE = re.compile(r'\w+')
+
+# Частые слова вопросов, которые не говорят ничего об услуге. Без них триграммы
+# «стоит» или «сколько» совпадали бы со «стоматологией» и «скидкой».
+STOP_WORDS = frozenset("""
+а в во вы вас ваш где да для до же за и из или к как какая какие какой ли мне на не но о об
+от по при про с со сколько стоит стоят стоимость цена цены цену у хочу хотела хотел можно есть это что
+подскажите пожалуйста здравствуйте
+qancha narxi narx necha bormi va uchun bu menga
+how much what is the a an of for to do does you your price cost please
+""".split())
+
+# Признаки вопроса о цене (ru / uz / en)
+PRICE_INTENT_RE = re.compile(
+    r'сколько\s+сто|стоимост|\bцен[аыуе]?\b|\bпочем\b|прайс|'
+    r'\bnarx|\bqancha\b|\bнарх|\bканча\b|\bқанча\b|'
+    r'\bprice|\bcost|how\s+much'
+)
+
+# Приведение текста к виду для поиска: нижний регистр, ё -> е
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+# Термы для поиска: слова и триграммы слов. Триграммы сглаживают падежи и опечатки:
+# «подмышек» и «подмышечные» совпадают по «под», «одм», «дмы», «мыш».
+def terms(text):
+    result = []
+    for word in WORD_RE.findall(normalize(text)):
+        if word in STOP_WORDS:
+            continue
+        result.append(word)
+        result.extend(word_trigrams(word))
+    return result
+
+def word_trigrams(word):
+    padded = f" {word} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+# Только триграммы слов: по ним сравнивается, насколько полно услуга покрывает вопрос.
+# Совпадение слова целиком добавило бы лишний терм той услуге, где случайно та же
+# словоформа: «эпиляция ног» выбрало бы «пальцев ног», а не «ноги полностью».
+def trigrams(text):
+    return {trigram for word in WORD_RE.findall(normalize(text)) if word not in STOP_WORDS
+            for trigram in word_trigrams(word)}
+
+# Обход вложенного словаря услуг: список CatalogItem для всех конечных позиций
+def flatten(services, prefix=()):
+    items = []
+    for name, value in services.items():
+        path = prefix + (name,)
+        if isinstance(value, dict):
+            items.extend(flatten(value, path))
+        else:
+            items.append(CatalogItem(path, value))
+    return items
+
+def has_price_intent(text):
+    return PRICE_INTENT_RE.search(normalize(text)) is not None
+
+# Раздел, к которому относится услуга: категория и подгруппа, если она есть
+def section_of(path):
+    return path[:2] if len(path) > 2 else path[:1]
+
+# Текст раздела для промпта: полный путь в заголовке и услуги с ценами
+def render_section(section, items):
+    lines = [" > ".join(section) + ":"]
+    for item in items:
+        lines.append("  " + " > ".join(item.path[len(section):]) + f": {item.price}")
+    return "\n".join(lines)
+
+# Поисковый индекс каталога (BM25 по словам и триграммам).
+# Документ — одна услуга с полным путём, оценка раздела — лучшая оценка его услуг.
+class CatalogIndex:
+    def __init__(self, services, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.items = flatten(services)
+        self.sections = defaultdict(list)
+        for item in self.items:
+            self.sections[section_of(item.path)].append(item)
+
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc_id, item in enumerate(self.items):
+            counts = defaultdict(int)
+            for term in terms(" ".join(item.path)):
+                counts[term] += 1
+            self.lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings[term].append((doc_id, count))
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+        # Знаменатель BM25 без частоты терма, заранее для каждой услуги
+        self.norms = [k1 * (1 - b + b * length / self.average_length) for length in self.lengths]
+        documents = len(self.items)
+        self.idf = {
+            term: math.log(1 + (documents - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    # Оценки BM25 услуг по запросу: {doc_id: score}
+    def score(self, query):
+        scores = defaultdict(float)
+        for term in set(terms(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            weight = self.idf[term] * (self.k1 + 1)
+            norms = self.norms
+            for doc_id, count in posting:
+                scores[doc_id] += weight * count / (count + norms[doc_id])
+        return scores
+
+    # Наиболее подходящие разделы: список (section, score) по убыванию оценки
+    def top_sections(self, query, k=CATALOG_TOP_K):
+        best = {}
+        for doc_id, score in self.score(query).items():
+            section = section_of(self.items[doc_id].path)
+            if score > best.get(section, 0):
+                best[section] = score
+        if not best:
+            return []
+        ranked = sorted(best.items(), key=lambda pair: pair[1], reverse=True)
+        if ranked[0][1] < CATALOG_MIN_SCORE:
+            return []
+        threshold = ranked[0][1] * CATALOG_MIN_RELATIVE_SCORE
+        return [(section, score) for section, score in ranked[:k] if score >= threshold]
+
+    # Услуга, о которой вопрос: номер лучшей по оценке услуги или -1, если совпадение случайное
+    def topic(self, query):
+        scores = self.score(query)
+        if not scores:
+            return -1
+        doc_id = max(scores, key=lambda doc_id: (scores[doc_id], -doc_id))
+        return doc_id if scores[doc_id] >= CATALOG_MIN_SCORE else -1
+
+    # Сколько триграмм нашлось в пути каждой услуги с ценой
+    def coverage(self, query_terms):
+        coverage = defaultdict(int)
+        for term in query_terms:
+            for doc_id, _ in self.postings.get(term, ()):
+                if self.items[doc_id].price is not None:
+                    coverage[doc_id] += 1
+        return coverage
+
+    # Услуги с ценой, которые однозначно отвечают на вопрос; пустой список — ответ
+    # неоднозначен, и вопрос уходит в OpenAI. Услуга подходит, если в её пути нашлась
+    # большая часть термов вопроса и ни одна другая услуга не покрывает их так же полно.
+    # Равное покрытие у нескольких услуг допускается, только если это варианты одной
+    # услуги из одного раздела и их не больше PRICE_MAX_OPTIONS (зона для женщин и для
+    # мужчин). «Пилинг» или «повторная консультация» без уточнения одинаково покрывают
+    # услуги разных разделов, и какая из них наберёт больше BM25 (по повторам слов или
+    # длине пути), ничего не говорит. Услуга, которой до лучшей не хватает одной
+    # триграммы, отличается от неё только словоформой («ног» и «ноги»): вопрос тоже
+    # неоднозначен.
+    # context — предыдущий вопрос, к которому относится уточнение: из услуг, одинаково
+    # покрывающих вопрос («а сколько стоит повторная?»), остаются те, что лучше покрывают
+    # context («первичная консультация флеболога»). Выбрать услугу, которой в вопросе нет,
+    # context не может. Если найденная услуга покрывает context заметно хуже, чем лучшая
+    # услуга каталога (меньше PRICE_MIN_CONTEXT_COVERAGE), она с ним не связана: «а для
+    # мужчин?» после вопроса об эпиляции нашло бы HydraFacial For Men. Такой вопрос
+    # уходит в OpenAI вместе с историей.
+    def resolve_price(self, query, context=None):
+        query_terms = trigrams(query)
+        if not query_terms:
+            return []
+        coverage = self.coverage(query_terms)
+        if not coverage:
+            return []
+        best = max(coverage.values())
+        if best / len(query_terms) < PRICE_MIN_COVERAGE:
+            return []
+        if any(covered == best - 1 for covered in coverage.values()):
+            return []
+        options = [doc_id for doc_id, covered in coverage.items() if covered == best]
+        if context:
+            context_coverage = self.coverage(trigrams(context))
+            best_context = max((context_coverage[doc_id] for doc_id in options), default=0)
+            if not best_context or best_context < PRICE_MIN_CONTEXT_COVERAGE * max(context_coverage.values()):
+                return []
+            options = [doc_id for doc_id in options if context_coverage[doc_id] == best_context]
+        if len(options) > PRICE_MAX_OPTIONS or \
+                len({section_of(self.items[doc_id].path) for doc_id in options}) > 1:
+            return []
+        scores = self.score(query)
+        options.sort(key=lambda doc_id: (-scores[doc_id], doc_id))
+        return [self.items[doc_id] for doc_id in options]
+
+    # Список категорий без цен — для вопросов, в которых не упомянута конкретная услуга
+    def overview_text(self):
+        categories = dict.fromkeys(item.path[0] for item in self.items)
+        return "Categories of services (ask the patient which one they mean):\n" + \
+            "\n".join(f"  {category}" for category in categories) + "\n"
+
+    # Текст только тех разделов каталога, которые относятся к вопросу.
+    # None — отбор выключен (CATALOG_TOP_K=0), и вызывающий код отправляет каталог целиком.
+    def relevant_text(self, query, k=CATALOG_TOP_K):
+        if k <= 0:
+            return None
+        return self.sections_text(self.top_sections(query, k))
+
+    # Текст для промпта по результату top_sections
+    def sections_text(self, sections):
+        if not sections:
+            return self.overview_text()
+        return "\n".join(render_section(section, self.sections[section]) for section, _ in sections) + "\n"
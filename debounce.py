@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+# Сколько секунд ждать продолжения, прежде чем отвечать на сообщение; 0 — отвечать сразу.
+# Выключено по умолчанию: ожидание прибавляется к времени до первого текста ответа,
+# а ответ идёт в отдельной задаче вне очереди чата (updates.ChatScheduler), поэтому
+# ответ на следующее сообщение («где вы находитесь») может прийти раньше него.
+MESSAGE_DEBOUNCE = float(os.getenv('MESSAGE_DEBOUNCE', 0))
+
+# Сообщения чата, ожидающие общего ответа
+class PendingReply:
+    __slots__ = ('texts', 'task', 'answering', 'reply')
+
+    def __init__(self):
+        self.texts = []
+        self.task = None
+        self.answering = False
+        # Ответ, который показывается пациенту; переиспользуется, если запрос пришлось повторить
+        self.reply = None
+
+# Объединение сообщений, которые пациент отправляет частями («здравствуйте» /
+# «хотела узнать» / «сколько стоит чистка»), в один запрос к OpenAI. Сообщения, на
+# которые отвечают каталог или кэш, сюда не попадают (см. bot.handle_message).
+# Ответ откладывается на window секунд; каждое новое сообщение чата за это время
+# присоединяется к ожидающим и откладывает ответ заново. Если ответ уже готовится,
+# новое сообщение отменяет его, и запрос повторяется для всего текста.
+# Ответ идёт в отдельной задаче: обработчик обновления сразу освобождается,
+# иначе планировщик не передал бы ему следующее сообщение того же чата.
+class ChatDebouncer:
+    def __init__(self, window=MESSAGE_DEBOUNCE):
+        self.window = window
+        self.pending = {}
+        self.messages = 0
+        self.merged = 0
+        self.superseded = 0
+        self.answered = 0
+
+    # Есть ли у чата сообщения, ожидающие ответа
+    def waiting(self, key):
+        return key in self.pending
+
+    # respond(text, pending) отвечает на объединённый текст; spawn(coroutine) запускает задачу
+    def submit(self, key, text, respond, spawn):
+        self.messages += 1
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = PendingReply()
+        else:
+            self.merged += 1
+            if pending.answering:
+                self.superseded += 1
+            pending.task.cancel()
+        pending.texts.append(text)
+        pending.answering = False
+        pending.task = spawn(self._flush(key, pending, respond))
+
+    async def _flush(self, key, pending, respond):
+        try:
+            await asyncio.sleep(self.window)
+            pending.answering = True
+            await respond("\n".join(pending.texts), pending)
+            self.answered += 1
+        finally:
+            # Отменённая задача уже заменена новой, и ожидающие сообщения остаются ей
+            if self.pending.get(key) is pending and pending.task is asyncio.current_task():
+                del self.pending[key]
+
+    def stats(self):
+        return {
+            "waiting_chats": len(self.pending),
+            "messages": self.messages,
+            "merged": self.merged,
+            "superseded": self.superseded,
+            "answered": self.answered,
+        }
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import aiohttp
+import openai
+
+from ratelimit import OPENAI_RPM, OPENAI_TPM, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Точки доступа к модели: JSON-список объектов с полями name, api_key, api_base,
+# api_type («open_ai», «azure»), api_version, organization, deployments (модель ->
+# имя развёртывания Azure), rpm, tpm. Без настройки — одна точка с глобальными
+# openai.api_key и openai.api_base.
+OPENAI_ENDPOINTS = os.getenv('OPENAI_ENDPOINTS')
+# После ошибки точка пропускается ENDPOINT_COOLDOWN секунд, после каждой следующей
+# ошибки подряд — вдвое дольше, но не дольше ENDPOINT_MAX_COOLDOWN
+ENDPOINT_COOLDOWN = float(os.getenv('ENDPOINT_COOLDOWN', 5))
+ENDPOINT_MAX_COOLDOWN = float(os.getenv('ENDPOINT_MAX_COOLDOWN', 60))
+# Остаток квоты (доля RPM/TPM), ниже которого точка получает запросы, только если другим хуже
+ENDPOINT_QUOTA_RESERVE = float(os.getenv('ENDPOINT_QUOTA_RESERVE', 0.1))
+# Сколько точек пробовать для одного запроса
+ENDPOINT_MAX_ATTEMPTS = int(os.getenv('ENDPOINT_MAX_ATTEMPTS', 2))
+# Доля запросов, которые идут в случайную исправную точку, чтобы заметить, что она снова быстрая
+ENDPOINT_EXPLORE = float(os.getenv('ENDPOINT_EXPLORE', 0.05))
+# Вес нового замера в скользящих средних задержки и доли ошибок
+ENDPOINT_SMOOTHING = 0.2
+# За столько секунд без новых ошибок доля ошибок точки уменьшается вдвое
+ENDPOINT_ERROR_HALF_LIFE = 60.0
+
+AZURE_API_TYPES = ('azure', 'azure_ad')
+
+# Ошибки, после которых запрос стоит повторить в другой точке. Неверный запрос
+# (InvalidRequestError) повторять бессмысленно, и точка в нём не виновата.
+def is_endpoint_failure(error):
+    if isinstance(error, openai.error.InvalidRequestError):
+        return False
+    return isinstance(error, (openai.error.OpenAIError, aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+# Ключ из заголовков запроса: Authorization: Bearer у OpenAI, api-key у Azure
+def request_key(headers):
+    authorization = headers.get('Authorization')
+    if authorization and authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    return headers.get('api-key')
+
+# Точка доступа: параметры подключения, свой ограничитель RPM/TPM и скользящая статистика
+class Endpoint:
+    def __init__(self, name, api_key=None, api_base=None, api_type=None, api_version=None, organization=None,
+                 deployments=None, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+        self.name = name
+        self.api_key = api_key
+        self.api_base = api_base
+        self.api_type = api_type
+        self.api_version = api_version
+        self.organization = organization
+        self.deployments = deployments or {}
+        self.rate_limiter = RateLimiter(rpm, tpm)
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.error_updated = 0.0
+        self.down_until = 0.0
+
+    def base_url(self):
+        return (self.api_base or openai.api_base).rstrip('/')
+
+    def key(self):
+        return self.api_key or openai.api_key
+
+    # Параметры openai.ChatCompletion.acreate для этой точки
+    def request_kwargs(self, kwargs):
+        params = dict(kwargs)
+        for key in ('api_key', 'api_base', 'api_type', 'api_version', 'organization'):
+            value = getattr(self, key)
+            if value is not None:
+                params[key] = value
+        if self.api_type in AZURE_API_TYPES:
+            params['deployment_id'] = self.deployments.get(params['model'], params['model'])
+        return params
+
+    # Доля квоты, оставшаяся по самому исчерпанному из лимитов
+    def headroom(self):
+        levels = [bucket.level / bucket.capacity
+                  for bucket in (self.rate_limiter.requests, self.rate_limiter.tokens) if bucket.capacity > 0]
+        return min(levels, default=1.0)
+
+    # Доля ошибок, затухающая со временем, чтобы точка после сбоя могла вернуть себе запросы
+    def recent_error_rate(self):
+        return self.error_rate * 0.5 ** ((time.monotonic() - self.error_updated) / ENDPOINT_ERROR_HALF_LIFE)
+
+    # Чем меньше, тем лучше: сначала точки с запасом квоты, среди них — по задержке
+    # с поправкой на ошибки и очередь. У точки без замеров задержка нулевая — первые
+    # запросы пробуют каждую точку.
+    def score(self):
+        latency = (self.latency or 0.0) * (1 + 4 * self.recent_error_rate())
+        latency *= 1 + sum(len(queue) for queue in self.rate_limiter.queues.values())
+        return self.headroom() < ENDPOINT_QUOTA_RESERVE, latency
+
+    def success(self, latency):
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.latency = latency if self.latency is None else \
+            self.latency + ENDPOINT_SMOOTHING * (latency - self.latency)
+        self.error_rate = self.recent_error_rate() * (1 - ENDPOINT_SMOOTHING)
+        self.error_updated = time.monotonic()
+
+    def failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate = self.recent_error_rate() + ENDPOINT_SMOOTHING * (1 - self.recent_error_rate())
+        self.error_updated = time.monotonic()
+        cooldown = min(ENDPOINT_COOLDOWN * 2 ** (self.consecutive_failures - 1), ENDPOINT_MAX_COOLDOWN)
+        self.down_until = time.monotonic() + cooldown
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "error_rate": round(self.recent_error_rate(), 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "down_for": round(max(self.down_until - time.monotonic(), 0.0), 1),
+            "headroom": round(self.headroom(), 3),
+            "rate_limit": self.rate_limiter.stats(),
+        }
+
+# Пул точек доступа: каждый запрос идёт в самую быструю из исправных точек,
+# при ошибке — в следующую. Точки, у которых кончается квота, отходят в конец
+# очереди, и нагрузка перетекает на остальные.
+class EndpointPool:
+    def __init__(self, endpoints, max_attempts=ENDPOINT_MAX_ATTEMPTS):
+        self.endpoints = endpoints
+        self.max_attempts = max_attempts
+        self.failovers = 0
+
+    # Точки в порядке предпочтения; если все на паузе после ошибок — раньше те, что вернутся первыми
+    def candidates(self):
+        now = time.monotonic()
+        healthy = sorted((endpoint for endpoint in self.endpoints if endpoint.down_until <= now),
+                         key=Endpoint.score)
+        if len(healthy) > 1 and random.random() < ENDPOINT_EXPLORE:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        resting = sorted((endpoint for endpoint in self.endpoints if endpoint.down_until > now),
+                         key=lambda endpoint: endpoint.down_until)
+        return (healthy + resting)[:self.max_attempts]
+
+    # Точка, которой принадлежит запрос (для заголовков x-ratelimit-*). У нескольких
+    # ключей одного api.openai.com общий URL, поэтому точка узнаётся и по ключу запроса.
+    def match(self, url, headers=None):
+        key = request_key(headers) if headers is not None else None
+        for endpoint in self.endpoints:
+            if url.startswith(endpoint.base_url()) and (key is None or endpoint.key() == key):
+                return endpoint
+        return None
+
+    def stats(self):
+        return {"failovers": self.failovers, "endpoints": [endpoint.stats() for endpoint in self.endpoints]}
+
+def load_endpoints(config=OPENAI_ENDPOINTS):
+    if not config:
+        return [Endpoint('openai')]
+    endpoints = [Endpoint(**item) for item in json.loads(config)]
+    if not endpoints:
+        raise ValueError("OPENAI_ENDPOINTS: нужна хотя бы одна точка доступа")
+    return endpoints
@@ -0,0 +1,222 @@
+import os
+import random
+import re
+import zlib
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from catalog import PRICE_INTENT_RE, normalize
+
+# Сообщения длиннее этого числа слов не считаются приветствием или благодарностью,
+# даже если начинаются с них («здравствуйте, подскажите, ...»)
+SMALL_TALK_MAX_WORDS = int(os.getenv('SMALL_TALK_MAX_WORDS', 4))
+# Уверенность модели, ниже которой сообщение без ключевых слов считается открытым вопросом
+INTENT_MIN_CONFIDENCE = float(os.getenv('INTENT_MIN_CONFIDENCE', 0.6))
+INTENT_DIM = 4096
+
+# Результат классификации: тип сообщения, язык (ru / uz / en или None) и уверенность
+Intent = namedtuple('Intent', ['name', 'language', 'confidence'])
+
+# Типы сообщений. question — открытый вопрос для OpenAI, price — вопрос о цене
+# (сначала ищется прямой ответ в каталоге), остальные обрабатываются без OpenAI.
+INTENTS = ('question', 'price', 'doctors', 'contacts', 'booking', 'greeting', 'thanks', 'goodbye')
+SMALL_TALK = frozenset(['greeting', 'thanks', 'goodbye'])
+# Типы, которые может выбрать модель. Готовые ответы (врачи, контакты, запись,
+# приветствие) даются только по ключевым словам: ошибка модели в них заметнее,
+# чем лишний вопрос к OpenAI.
+MODEL_INTENTS = ('question', 'price')
+# Если сообщение содержит ключевые слова нескольких типов, побеждает более ранний.
+# Цена раньше записи: «сколько стоит запись к дерматологу» — вопрос о цене.
+PRIORITY = ('price', 'booking', 'doctors', 'contacts', 'goodbye', 'thanks', 'greeting')
+
+# Начала слов по типам и языкам (uz — латиница и кириллица); совпадение ищется с начала
+# слова. Запись — только по глаголам: «запись» и «appointment» встречаются и в вопросах
+# о цене. Слова приветствия, благодарности и прощания совпадают только целиком:
+# «пока» не должно находиться в «показания».
+KEYWORDS = {
+    'booking': {
+        'ru': ['записат', 'запишит', 'запишус', 'хочу прийти', 'хочу на при'],
+        'uz': ['yozil', 'qabulga', "ro'yxatdan", 'ёзил', 'қабулга', 'кабулга'],
+        'en': ['book a', 'book me', 'book for', 'can i book', 'to book', 'make an appointment',
+               'schedule a', 'sign up'],
+    },
+    'doctors': {
+        'ru': ['врач', 'доктор', 'специалист', 'к кому обратит'],
+        'uz': ['shifokor', 'doktor', 'vrach', 'шифокор'],
+        'en': ['doctor', 'physician', 'specialist'],
+    },
+    'contacts': {
+        'ru': ['адрес', 'где наход', 'где вы', 'где клиник', 'как добрат', 'как до вас', 'телефон', 'номер телеф',
+               'контакт', 'сайт', 'почта', 'график работ', 'часы работ', 'режим работ', 'во сколько откр',
+               'до скольки'],
+        'uz': ['manzil', 'qayerda', 'telefon', 'kontakt', 'ish vaqt', 'манзил', 'қаерда', 'каерда', 'иш вақт'],
+        'en': ['address', 'where are you', 'where is the clinic', 'located', 'phone', 'contact', 'website', 'email',
+               'opening hours', 'working hours'],
+    },
+    'greeting': {
+        'ru': ['привет', 'приветствую', 'здравствуйте', 'здравствуй', 'здрасте', 'здрасьте', 'добрый день',
+               'добрый вечер', 'доброе утро', 'салам'],
+        'uz': ['salom', 'assalomu', 'assalom', 'салом', 'ассалому', 'ассалом', 'хайрли кун', 'hayrli kun',
+               'xayrli kun'],
+        'en': ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening'],
+    },
+    'thanks': {
+        'ru': ['спасибо', 'благодарю', 'благодарим', 'понятно', 'хорошо', 'ок', 'ясно'],
+        'uz': ['rahmat', 'raxmat', 'рахмат', 'раҳмат', 'tushunarli', 'yaxshi', 'тушунарли', 'яхши'],
+        'en': ['thank you', 'thanks', 'thank', 'thx', 'ok', 'okay', 'got it', 'great'],
+    },
+    'goodbye': {
+        'ru': ['до свидания', 'пока', 'всего доброго', 'до встречи'],
+        'uz': ["xayr", 'хайр', "ko'rishguncha", 'кўришгунча'],
+        'en': ['bye', 'goodbye', 'see you'],
+    },
+}
+
+# Все ключевые слова собраны в одно регулярное выражение: один проход по тексту находит
+# все совпадения, а имя группы (тип__язык) говорит, чьё это слово. Короткие слова
+# («ок», «hi») и слова SMALL_TALK должны совпасть целиком, остальные — как начало слова.
+def compile_keywords(keywords):
+    groups = []
+    for intent, languages in keywords.items():
+        for language, words in languages.items():
+            alternatives = "|".join(
+                re.escape(word) + (r'\b' if len(word) <= 3 or intent in SMALL_TALK else '')
+                for word in sorted(words, key=len, reverse=True)
+            )
+            groups.append(f"(?P<{intent}__{language}>{alternatives})")
+    return re.compile(r"(?<!\w)(?:" + "|".join(groups) + ")")
+
+KEYWORD_RE = compile_keywords(KEYWORDS)
+WORD_RE = re.compile(r"[\w']+")
+# Буквы, которые есть в узбекской кириллице, но не в русской
+UZ_CYRILLIC_RE = re.compile(r'[ўқғҳ]')
+CYRILLIC_RE = re.compile(r'[а-я]')
+UZ_LATIN_RE = re.compile(r"[og]'|\b(?:va|bu|men|siz|qanday|nima|qancha|narxi|bormi)\b")
+
+# Язык по письменности, если ключевые слова его не выдали
+def detect_language(text):
+    if UZ_CYRILLIC_RE.search(text):
+        return 'uz'
+    if CYRILLIC_RE.search(text):
+        return 'ru'
+    if UZ_LATIN_RE.search(text):
+        return 'uz'
+    if re.search(r'[a-z]', text):
+        return 'en'
+    return None
+
+# Признаки для линейной модели: слова и символьные 3-граммы слов, разложенные хешем по dim корзинам
+def features(text, dim=INTENT_DIM):
+    indices = []
+    for word in WORD_RE.findall(text):
+        indices.append(zlib.crc32(word.encode('utf-8')) % dim)
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            indices.append(zlib.crc32(padded[i:i + 3].encode('utf-8')) % dim)
+    return indices
+
+# Примеры для обучения линейной модели при запуске. Модель нужна для сообщений без
+# ключевых слов: отличить вопрос о цене с опечаткой («скока стоит») от открытого вопроса.
+TRAINING_SAMPLES = [
+    ("какие процедуры помогают от акне", 'question'),
+    ("можно ли делать пилинг летом", 'question'),
+    ("чем отличается биоревитализация от мезотерапии", 'question'),
+    ("больно ли делать лазерную эпиляцию", 'question'),
+    ("что лучше для омоложения кожи", 'question'),
+    ("у меня пигментные пятна что посоветуете", 'question'),
+    ("сколько сеансов нужно для эпиляции", 'question'),
+    ("есть ли противопоказания к ботоксу", 'question'),
+    ("какие показания к мезотерапии", 'question'),
+    ("вы лечите кариес у детей", 'question'),
+    ("кто проводит процедуру", 'question'),
+    ("есть ли сейчас акции", 'question'),
+    ("покажите фото до и после", 'question'),
+    ("здраствуйте можно вопрос", 'question'),
+    ("akne uchun qanday muolaja bor", 'question'),
+    ("lazer epilyatsiya og'riqlimi", 'question'),
+    ("qanday xizmatlar bor", 'question'),
+    ("what treatments do you have for acne", 'question'),
+    ("is laser hair removal painful", 'question'),
+    ("how many sessions do i need", 'question'),
+    ("what is botox", 'question'),
+    ("does epilation hurt", 'question'),
+    ("ботокс это безопасно", 'question'),
+    ("yuzim quruq nima qilish kerak", 'question'),
+    ("botoks xavfsizmi", 'question'),
+    ("сколько стоит чистка лица", 'price'),
+    ("скока стоит эпиляция", 'price'),
+    ("почем ботокс", 'price'),
+    ("цена консультации", 'price'),
+    ("прайс на услуги", 'price'),
+    ("скок стоит консультация", 'price'),
+    ("skolko stoit epilyatsiya", 'price'),
+    ("epilyatsiya necha pul", 'price'),
+    ("how mutch is botox", 'price'),
+]
+
+# Мультиномиальная логистическая регрессия по хешированным признакам, обучается SGD
+# при запуске за десятки миллисекунд; веса — матрица dim × MODEL_INTENTS
+def train(samples, dim=INTENT_DIM, epochs=30, learning_rate=0.5, seed=0):
+    weights = np.zeros((dim, len(MODEL_INTENTS)), dtype=np.float32)
+    data = []
+    for text, intent in samples:
+        indices, counts = np.unique(features(normalize(text), dim), return_counts=True)
+        data.append((indices, counts[:, None].astype(np.float32), MODEL_INTENTS.index(intent)))
+    rng = random.Random(seed)
+    for _ in range(epochs):
+        rng.shuffle(data)
+        for indices, counts, label in data:
+            scores = (weights[indices] * counts).sum(axis=0)
+            probabilities = np.exp(scores - scores.max())
+            probabilities /= probabilities.sum()
+            probabilities[label] -= 1.0
+            weights[indices] -= learning_rate * counts * probabilities
+    return weights
+
+# Классификатор сообщений: ключевые слова решают, если нашлись, линейная модель (вопрос
+# или цена) — если нет.
+# Сообщение, в котором модель не уверена, считается открытым вопросом для OpenAI.
+class IntentClassifier:
+    def __init__(self, samples=TRAINING_SAMPLES, dim=INTENT_DIM):
+        self.dim = dim
+        self.weights = train(samples, dim)
+        self.counts = Counter()
+
+    def predict(self, text):
+        indices = features(text, self.dim)
+        if not indices:
+            return 'question', 0.0
+        scores = self.weights[indices].sum(axis=0)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return MODEL_INTENTS[best], float(probabilities[best])
+
+    def classify(self, text):
+        intent = self._classify(normalize(text))
+        self.counts[intent.name] += 1
+        return intent
+
+    def _classify(self, text):
+        found = {}
+        for match in KEYWORD_RE.finditer(text):
+            intent, language = match.lastgroup.split('__')
+            found.setdefault(intent, language)
+        if PRICE_INTENT_RE.search(text):
+            found.setdefault('price', None)
+        language = next((language for language in found.values() if language is not None), None) \
+            or detect_language(text)
+
+        short = len(WORD_RE.findall(text)) <= SMALL_TALK_MAX_WORDS
+        for intent in PRIORITY:
+            if intent in found and (short or intent not in SMALL_TALK):
+                return Intent(intent, language, 1.0)
+
+        intent, confidence = self.predict(text)
+        if confidence < INTENT_MIN_CONFIDENCE:
+            return Intent('question', language, confidence)
+        return Intent(intent, language, confidence)
+
+    def stats(self):
+        return dict(self.counts)
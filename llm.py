@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+
+import aiohttp
+import openai
+from telegram.ext import Application
+
+from endpoints import EndpointPool, is_endpoint_failure, load_endpoints
+from ratelimit import RATE_LIMIT_COMPLETION_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Настройки HTTP-соединений с OpenAI
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+OPENAI_KEEPALIVE = float(os.getenv('OPENAI_KEEPALIVE', 60))
+# Просить usage в конце потокового ответа (stream_options.include_usage); старые версии
+# API Azure этот параметр не принимают
+OPENAI_STREAM_USAGE = os.getenv('OPENAI_STREAM_USAGE', '1') == '1'
+
+# Общая сессия aiohttp: соединения с api.openai.com переиспользуются между запросами
+session = None
+# Точки доступа к модели (OpenAI, Azure), у каждой свой ограничитель RPM/TPM
+pool = EndpointPool(load_endpoints())
+
+# Заголовки x-ratelimit-* приходят в каждом ответе, но openai 0.27 их не отдаёт,
+# поэтому они читаются из трассировки сессии
+async def on_request_end(session, context, params):
+    endpoint = pool.match(str(params.url), params.headers)
+    if endpoint is not None:
+        endpoint.rate_limiter.observe(params.response.status, params.response.headers)
+
+# Открытие сессии при запуске приложения (ApplicationBuilder.post_init)
+async def open_session(application: Application) -> None:
+    global session
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(on_request_end)
+    session = aiohttp.ClientSession(
+        trace_configs=[trace_config],
+        connector=aiohttp.TCPConnector(limit=OPENAI_MAX_CONNECTIONS, keepalive_timeout=OPENAI_KEEPALIVE),
+        timeout=aiohttp.ClientTimeout(total=OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+# Закрытие сессии при остановке приложения (ApplicationBuilder.post_shutdown)
+async def close_session(application: Application) -> None:
+    global session
+    if session is not None:
+        await session.close()
+        session = None
+
+# Запрос в лучшую точку пула с переходом в следующую при ошибке.
+# Возвращает результат acreate, точку и момент начала запроса.
+async def create(rate_key, rate_tokens, kwargs):
+    # openai 0.27 передаёт в каждый запрос свой ClientTimeout(total=600), и таймауты
+    # сессии не действуют; request_timeout=(connect, total) он передаёт в aiohttp
+    kwargs = dict(kwargs)
+    kwargs.setdefault('request_timeout', (OPENAI_CONNECT_TIMEOUT, OPENAI_TIMEOUT))
+    error = previous = None
+    for attempt, endpoint in enumerate(pool.candidates()):
+        if attempt:
+            pool.failovers += 1
+            logger.warning("Точка %s не ответила (%s), запрос уходит в %s",
+                           previous.name, type(error).__name__, endpoint.name)
+        await endpoint.rate_limiter.acquire(rate_key, rate_tokens + RATE_LIMIT_COMPLETION_TOKENS)
+        # openai.aiosession — ContextVar, задачи обработчиков не всегда его наследуют,
+        # поэтому сессия выставляется в контексте каждого запроса
+        openai.aiosession.set(session)
+        started = time.monotonic()
+        try:
+            return await openai.ChatCompletion.acreate(**endpoint.request_kwargs(kwargs)), endpoint, started
+        except Exception as exc:
+            if not is_endpoint_failure(exc):
+                raise
+            endpoint.failure()
+            error, previous = exc, endpoint
+    raise error
+
+# Асинхронный запрос к Chat Completions, не блокирующий цикл событий.
+# rate_key — чат, в очереди которого запрос ждёт лимита; rate_tokens — оценка токенов промпта.
+async def chat_completion(rate_key=None, rate_tokens=0, **kwargs):
+    response, endpoint, started = await create(rate_key, rate_tokens, kwargs)
+    endpoint.success(time.monotonic() - started)
+    return response
+
+# Потоковый запрос к Chat Completions: по мере генерации отдаёт новые фрагменты текста.
+# Задержка точки — время до первого фрагмента; ошибка посреди потока тоже засчитывается точке.
+# usage — словарь, в который записывается usage ответа из последнего фрагмента.
+async def stream_chat_completion(rate_key=None, rate_tokens=0, usage=None, **kwargs):
+    kwargs = dict(kwargs, stream=True)
+    if usage is not None and OPENAI_STREAM_USAGE:
+        kwargs['stream_options'] = {"include_usage": True}
+    chunks, endpoint, started = await create(rate_key, rate_tokens, kwargs)
+    first = True
+    try:
+        async for chunk in chunks:
+            if first:
+                endpoint.success(time.monotonic() - started)
+                first = False
+            if not chunk.choices:
+                # Последний фрагмент при include_usage: без choices, с usage всего ответа
+                if usage is not None and chunk.get('usage'):
+                    usage.update(chunk['usage'])
+                continue
+            delta = chunk.choices[0].delta.get('content')
+            if delta:
+                yield delta
+    except Exception as exc:
+        if is_endpoint_failure(exc):
+            endpoint.failure()
+        raise
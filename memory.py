@@ -0,0 +1,123 @@
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+from catalog import normalize
+from prompts import estimate_tokens
+
+# Настройки памяти диалога
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 600))
+HISTORY_SUMMARY_BUDGET = int(os.getenv('HISTORY_SUMMARY_BUDGET', 150))
+HISTORY_MAX_TURNS = int(os.getenv('HISTORY_MAX_TURNS', 8))
+HISTORY_IDLE_TTL = float(os.getenv('HISTORY_IDLE_TTL', 30 * 60))
+HISTORY_MAX_CHATS = int(os.getenv('HISTORY_MAX_CHATS', 10000))
+# Длинные ответы бота хранятся обрезанными — для контекста достаточно начала
+HISTORY_ANSWER_CHARS = int(os.getenv('HISTORY_ANSWER_CHARS', 400))
+
+# Начало уточнения («а для мужчин?», «и ещё…») и местоимения, которые ссылаются на прошлую реплику
+FOLLOW_UP_RE = re.compile(
+    r"^(?:а|и|еще|также|тогда|and|also|what about|how about|va|yana)\b|"
+    r"\b(?:это|этого|этой|этот|эта|эти|его|ее|их|него|нее|них|там|такой|такая|такие|"
+    r"it|this|that|these|those|they|them|bu|shu|ular)\b"
+)
+
+# Вопрос ссылается на предыдущую реплику и без неё непонятен
+def refers_back(text):
+    return FOLLOW_UP_RE.search(normalize(text).strip()) is not None
+
+# Диалог одного чата: последние реплики и краткая сводка более ранних вопросов
+class ChatHistory:
+    __slots__ = ('turns', 'tokens', 'summary', 'last_seen')
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.summary = deque()
+        self.last_seen = time.monotonic()
+
+# Память диалогов с жёстким бюджетом токенов на чат.
+# Последние реплики хранятся в кольцевом буфере; когда они не помещаются в бюджет,
+# самые старые сворачиваются в сводку из вопросов пациента (без запроса к OpenAI),
+# а сводка в свою очередь ограничена HISTORY_SUMMARY_BUDGET. Чаты, молчащие дольше
+# HISTORY_IDLE_TTL, и самые давние сверх HISTORY_MAX_CHATS удаляются.
+class ConversationMemory:
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, summary_budget=HISTORY_SUMMARY_BUDGET,
+                 max_turns=HISTORY_MAX_TURNS, idle_ttl=HISTORY_IDLE_TTL, max_chats=HISTORY_MAX_CHATS):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_chats = max_chats
+        self.chats = OrderedDict()
+
+    def _evict(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self.chats:
+            chat_id, history = next(iter(self.chats.items()))
+            if len(self.chats) <= self.max_chats and history.last_seen >= deadline:
+                break
+            del self.chats[chat_id]
+
+    def _get(self, chat_id):
+        self._evict()
+        return self.chats.get(chat_id)
+
+    def has_history(self, chat_id):
+        return self._get(chat_id) is not None
+
+    # Сколько реплик диалога помнится (без учёта сводки)
+    def depth(self, chat_id):
+        history = self._get(chat_id)
+        return len(history.turns) if history is not None else 0
+
+    # Последний вопрос пациента — для поиска по каталогу при уточняющих вопросах
+    def last_question(self, chat_id):
+        history = self._get(chat_id)
+        if history is None or not history.turns:
+            return None
+        return history.turns[-1][0]
+
+    # Сообщения истории для промпта: сводка и последние реплики
+    def messages(self, chat_id):
+        history = self._get(chat_id)
+        if history is None:
+            return []
+        messages = []
+        if history.summary:
+            messages.append({"role": "system",
+                             "content": "Earlier in this conversation the patient asked: " + "; ".join(history.summary)})
+        for question, answer, _ in history.turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def _fold(self, history, question):
+        history.summary.append(question)
+        while len(history.summary) > 1 and estimate_tokens("; ".join(history.summary)) > self.summary_budget:
+            history.summary.popleft()
+
+    def add(self, chat_id, question, answer):
+        history = self._get(chat_id)
+        if history is None:
+            history = self.chats[chat_id] = ChatHistory(self.max_turns)
+        # Порядок чатов совпадает с порядком last_seen, поэтому вытеснение идёт с начала
+        history.last_seen = time.monotonic()
+        self.chats.move_to_end(chat_id)
+
+        if len(answer) > HISTORY_ANSWER_CHARS:
+            answer = answer[:HISTORY_ANSWER_CHARS] + "…"
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        if len(history.turns) == history.turns.maxlen:
+            old_question, _, old_tokens = history.turns.popleft()
+            history.tokens -= old_tokens
+            self._fold(history, old_question)
+        history.turns.append((question, answer, tokens))
+        history.tokens += tokens
+        while len(history.turns) > 1 and history.tokens > self.token_budget:
+            old_question, _, old_tokens = history.turns.popleft()
+            history.tokens -= old_tokens
+            self._fold(history, old_question)
+
+    def stats(self):
+        return {"chats": len(self.chats)}
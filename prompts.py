@@ -0,0 +1,95 @@
+import hashlib
+import json
+import math
+import re
+
+TOKEN_RE = re.compile(r'[A-Za-z]+|[^\W\d_]+|\d+|\S')
+
+# Грубая локальная оценка числа токенов без токенизатора OpenAI: латиница — около
+# 4 символов на токен, кириллица — около 3, числа — по 3 цифры, знаки — по одному
+def estimate_tokens(text):
+    tokens = 0
+    for piece in TOKEN_RE.findall(text):
+        if piece.isascii() and piece.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece.isalpha():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+# Оценка токенов для списка сообщений Chat Completions (по 4 служебных токена на сообщение).
+# У вызова функции вместо текста — имя и аргументы.
+def estimate_messages_tokens(messages):
+    tokens = 2
+    for message in messages:
+        tokens += estimate_tokens(message["content"] or "") + 4
+        function_call = message.get("function_call")
+        if function_call:
+            tokens += estimate_tokens(function_call["name"]) + estimate_tokens(function_call.get("arguments") or "")
+    return tokens
+
+# Каноническая сериализация справочных данных: один и тот же словарь всегда даёт
+# одни и те же байты, независимо от порядка ключей в исходном коде
+def canonical_json(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+INSTRUCTIONS = (
+    "You are a helpful assistant for the Mediva medical clinic. Answer questions about its services, "
+    "prices, doctors and contacts using the reference data below; never guess prices."
+)
+TOOLS_INSTRUCTIONS = (
+    "You are a helpful assistant for the Mediva medical clinic. Use the functions to look up services, "
+    "prices, doctors and contacts; never guess prices."
+)
+
+# Системные сообщения для запроса к OpenAI, собранные заранее.
+# Сообщения идут в порядке от неизменного к переменному, чтобы OpenAI мог
+# кэшировать общий префикс запросов (prompt caching): сначала инструкция, контакты
+# и врачи (и весь каталог, если отбор разделов выключен) — одинаковые байты для всех
+# языков и вопросов, затем история диалога, и только в конце язык ответа, выбранные
+# под вопрос разделы каталога и сам вопрос.
+# Каталог, контакты и врачи меняются только вместе с кодом, поэтому префикс
+# строится один раз при запуске и пересобирается через rebuild() при их изменении.
+# Сообщения хранятся в кортежах и не должны изменяться вызывающим кодом.
+class SystemPrompts:
+    def __init__(self, languages):
+        self.languages = languages
+        self.prefix = ()
+        self.full_prefix = ()
+        self.tools_prefix = ()
+        self.version = None
+
+    def rebuild(self, services, contact_info, doctors):
+        self.prefix = (
+            {"role": "system", "content": INSTRUCTIONS},
+            {"role": "system", "content": "Clinic contacts and doctors (JSON):\n" +
+                                          canonical_json({"contacts": contact_info, "doctors": doctors})},
+        )
+        self.full_prefix = self.prefix + (
+            {"role": "system", "content": "Price list of all services (JSON):\n" + canonical_json(services)},
+        )
+        self.tools_prefix = ({"role": "system", "content": TOOLS_INSTRUCTIONS},)
+        # Версия содержимого: меняется при любом изменении каталога, контактов или врачей
+        content = "\n".join(message["content"] for message in self.full_prefix)
+        self.version = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+    # Переменная часть в конце: язык ответа и выбранные под вопрос разделы каталога
+    def tail(self, language, services_text=None):
+        content = f"Respond in {self.languages[language]}."
+        if services_text is not None:
+            content = f"Services and prices relevant to the question:\n{services_text}{content}"
+        return {"role": "system", "content": content}
+
+    # Полный список сообщений для запроса: неизменный префикс, история диалога,
+    # переменная часть и вопрос пользователя.
+    # services_text — выборка из каталога под вопрос; без неё весь каталог входит в префикс.
+    def build(self, language, user_input, services_text=None, history=()):
+        prefix = self.full_prefix if services_text is None else self.prefix
+        return [*prefix, *history, self.tail(language, services_text), {"role": "user", "content": user_input}]
+
+    # Сообщения для режима вызова функций: короткое вступление без справочных данных
+    def build_for_tools(self, language, user_input, history=()):
+        return [*self.tools_prefix, *history, self.tail(language), {"role": "user", "content": user_input}]
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Лимиты OpenAI на ключ: запросов и токенов в минуту; 0 — без ограничения.
+# Уточняются по заголовкам x-ratelimit-* ответов, поэтому важны только для старта.
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', 500))
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', 30000))
+# Сколько токенов ответа резервировать сверх оценки промпта
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv('RATE_LIMIT_COMPLETION_TOKENS', 300))
+
+DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# Длительность из заголовков OpenAI: «1s», «6m0s», «120ms»
+def parse_duration(value):
+    if not value:
+        return None
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Ведро токенов: вмещает лимит на минуту и наполняется равномерно
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    # Через сколько секунд в ведре наберётся amount
+    def wait_time(self, amount):
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount):
+        if self.capacity > 0:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    # Уточнение по ответу OpenAI: лимит ключа и остаток, общий для всех процессов с этим ключом
+    def update(self, limit, remaining):
+        if limit:
+            self._refill()
+            self.capacity = limit
+        if remaining is not None and self.capacity > 0:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+# Ограничитель запросов к OpenAI по RPM и TPM с честной очередью по пользователям.
+# Пока ведра не пусты и очереди нет, запрос проходит сразу. Иначе он ждёт в очереди
+# своего чата, а очереди обслуживаются по кругу: частые вопросы одного пациента не
+# задерживают остальных дольше, чем на один его запрос.
+class RateLimiter:
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.queues = OrderedDict()
+        self.dispatcher = None
+        self.paused_until = 0.0
+        self.granted = 0
+        self.queued = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _delay(self, tokens):
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens), self.paused_until - time.monotonic())
+
+    def _grant(self, tokens, enqueued):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        wait = time.monotonic() - enqueued
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    # Дождаться разрешения на запрос с оценкой tokens токенов; key — чат пациента
+    async def acquire(self, key, tokens):
+        enqueued = time.monotonic()
+        if not self.queues and self._delay(tokens) <= 0:
+            self._grant(tokens, enqueued)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(key, deque()).append((future, tokens, enqueued))
+        self.queued += 1
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.ensure_future(self._dispatch())
+        # Отмена ожидающего отменяет future, и диспетчер его пропускает
+        await future
+
+    async def _dispatch(self):
+        while self.queues:
+            key, queue = next(iter(self.queues.items()))
+            future, tokens, enqueued = queue[0]
+            if not future.done():
+                delay = self._delay(tokens)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                self._grant(tokens, enqueued)
+                future.set_result(None)
+            queue.popleft()
+            if queue:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+
+    # Заголовки ответа OpenAI: лимиты и остатки ключа, а при 429 — пауза до сброса
+    def observe(self, status, headers):
+        self.requests.update(parse_int(headers.get('x-ratelimit-limit-requests')),
+                             parse_int(headers.get('x-ratelimit-remaining-requests')))
+        self.tokens.update(parse_int(headers.get('x-ratelimit-limit-tokens')),
+                           parse_int(headers.get('x-ratelimit-remaining-tokens')))
+        if status == 429:
+            self.throttled += 1
+            pause = parse_duration(headers.get('retry-after')) or max(
+                parse_duration(headers.get('x-ratelimit-reset-requests')) or 0,
+                parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0,
+            ) or 1.0
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            logger.warning("OpenAI вернул 429, запросы приостановлены на %.1f с", pause)
+
+    def stats(self):
+        return {
+            "waiting": sum(len(queue) for queue in self.queues.values()),
+            "waiting_chats": len(self.queues),
+            "granted": self.granted,
+            "queued": self.queued,
+            "throttled": self.throttled,
+            "avg_wait": round(self.total_wait / self.granted, 4) if self.granted else 0.0,
+            "max_wait": round(self.max_wait, 4),
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level, 1),
+        }
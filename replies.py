@@ -0,0 +1,38 @@
+import json
+import time
+from contextvars import ContextVar
+
+from telegram.request import HTTPXRequest
+
+# Методы Bot API, которые можно вернуть в теле ответа вебхука
+INLINE_METHODS = frozenset(['sendMessage'])
+
+# Future обрабатываемого обновления: вебхук ждёт в нём первый ответ обработчика
+inline_reply = ContextVar('inline_reply', default=None)
+
+# Запретить ответ в теле вебхука для текущего обновления (например, если сообщение потом будут редактировать)
+def disable_inline_reply():
+    future = inline_reply.get()
+    if future is not None and not future.done():
+        future.cancel()
+
+# Транспорт Bot API, который отдаёт первый sendMessage обработчика в ответ на вебхук, а не отдельным запросом.
+# Если вебхук уже ответил (Future отменён или заполнен), запрос уходит в Bot API как обычно.
+class InlineReplyRequest(HTTPXRequest):
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        future = inline_reply.get()
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint not in INLINE_METHODS or request_data is None or future is None or future.done():
+            return await super().do_request(url, method, request_data, **kwargs)
+
+        params = request_data.parameters
+        future.set_result(dict(params, method=endpoint))
+        # Telegram не вернёт отправленное сообщение, поэтому собираем его сами;
+        # message_id неизвестен, такое сообщение нельзя редактировать
+        message = {
+            "message_id": 0,
+            "date": int(time.time()),
+            "chat": {"id": params['chat_id'], "type": "private"},
+            "text": params.get('text'),
+        }
+        return 200, json.dumps({"ok": True, "result": message}).encode('utf-8')
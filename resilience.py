@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from endpoints import is_endpoint_failure
+
+logger = logging.getLogger(__name__)
+
+# Предельное время ответа OpenAI на один вопрос, включая дублирующий запрос и весь поток
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 20))
+# Дублирующий запрос отправляется, если ответа нет дольше этой квантили задержек
+HEDGE_QUANTILE = float(os.getenv('HEDGE_QUANTILE', 0.95))
+# Сколько последних задержек помнить и сколько нужно, чтобы квантиль имела смысл
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', 200))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))
+# Автомат защиты: сколько ошибок подряд размыкают его и через сколько секунд пробовать снова
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+
+# OpenAI недоступен: автомат разомкнут, вышло время или оба запроса завершились ошибкой.
+# Неверный запрос (InvalidRequestError) не повторяется и передаётся вызывающему как есть.
+class UpstreamUnavailable(Exception):
+    pass
+
+# Скользящее окно последних задержек
+class LatencyTracker:
+    def __init__(self, size=LATENCY_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, latency):
+        self.samples.append(latency)
+
+    # Квантиль задержки; None, пока замеров слишком мало
+    def quantile(self, q):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+# Автомат защиты (circuit breaker). После failure_threshold ошибок подряд размыкается,
+# и запросы сразу получают отказ; раз в reset_timeout пропускается один пробный запрос:
+# успех замыкает автомат, ошибка снова размыкает его.
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+
+    def allow(self):
+        now = time.monotonic()
+        if self.state == self.CLOSED:
+            return True
+        # Пробный запрос, отменённый вызывающим, не держит автомат: через reset_timeout пускается новый
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        self.state = self.HALF_OPEN
+        self.opened_at = now
+        return True
+
+    def success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning("OpenAI недоступен, автомат защиты разомкнут после %d ошибок", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+# Защита вызовов OpenAI: общий срок на вопрос, дублирующий (hedged) запрос, если первый
+# не ответил за квантиль HEDGE_QUANTILE обычной задержки или сразу упал, и автомат защиты.
+# Из двух запросов берётся первый успешный ответ, второй отменяется. Задержки полного
+# ответа и первого фрагмента потока распределены по-разному, поэтому учитываются отдельно.
+class LLMGuard:
+    def __init__(self, deadline=LLM_DEADLINE, hedge_quantile=HEDGE_QUANTILE, breaker=None):
+        self.deadline = deadline
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker or CircuitBreaker()
+        self.completion_latency = LatencyTracker()
+        self.first_token_latency = LatencyTracker()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _unavailable(self, reason, error=None):
+        self.breaker.failure()
+        return UpstreamUnavailable(reason) if error is None else UpstreamUnavailable(f"{reason}: {error!r}")
+
+    # factory() создаёт корутину запроса; discard(result) освобождает ответ проигравшего запроса
+    async def call(self, factory, tracker=None, discard=None, deadline=None):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable("circuit open")
+        tracker = tracker or self.completion_latency
+        started = time.monotonic()
+        deadline = started + (self.deadline if deadline is None else deadline)
+        hedge_at = tracker.quantile(self.hedge_quantile)
+        hedge_at = None if hedge_at is None else started + hedge_at
+        tasks = [asyncio.ensure_future(factory())]
+        hedge = None
+        error = None
+        try:
+            while True:
+                now = time.monotonic()
+                # Дублирующий запрос: первый слишком долго молчит или уже завершился ошибкой
+                if hedge is None and (not tasks or (hedge_at is not None and now >= hedge_at)):
+                    hedge = asyncio.ensure_future(factory())
+                    tasks.append(hedge)
+                    self.hedges += 1
+                if not tasks or now >= deadline:
+                    break
+                timeout = deadline - now
+                if hedge is None and hedge_at is not None:
+                    timeout = min(timeout, hedge_at - now)
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        # Повтор неверного запроса упадёт так же, и OpenAI в этом не виноват
+                        if not is_endpoint_failure(error):
+                            raise error
+                        continue
+                    if task is hedge:
+                        self.hedge_wins += 1
+                    tracker.add(time.monotonic() - started)
+                    self.breaker.success()
+                    return task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+        if error is not None and not tasks:
+            self.failures += 1
+            raise self._unavailable("request failed", error) from error
+        self.timeouts += 1
+        raise self._unavailable("deadline exceeded")
+
+    # Поток фрагментов ответа под той же защитой: дублируется ожидание первого фрагмента,
+    # а остаток потока должен уложиться в общий срок
+    async def stream(self, open_stream):
+        started = time.monotonic()
+
+        async def first_chunk():
+            chunks = open_stream()
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+
+        async def discard(result):
+            await result[1].aclose()
+
+        chunk, chunks = await self.call(first_chunk, self.first_token_latency, discard)
+        try:
+            while chunk is not None:
+                yield chunk
+                remaining = started + self.deadline - time.monotonic()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(remaining, 0))
+                except StopAsyncIteration:
+                    chunk = None
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise self._unavailable("deadline exceeded") from None
+        except Exception as error:
+            if not is_endpoint_failure(error):
+                raise
+            self.failures += 1
+            raise self._unavailable("stream failed", error) from error
+        finally:
+            await chunks.aclose()
+
+    def stats(self):
+        completion_p95 = self.completion_latency.quantile(self.hedge_quantile)
+        first_token_p95 = self.first_token_latency.quantile(self.hedge_quantile)
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "consecutive_failures": self.breaker.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "completion_hedge_after": round(completion_p95, 3) if completion_p95 is not None else None,
+            "first_token_hedge_after": round(first_token_p95, 3) if first_token_p95 is not None else None,
+        }
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+# Модели: основная и быстрая дешёвая для простых вопросов
+DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'gpt-4o')
+CHEAP_MODEL = os.getenv('CHEAP_MODEL', 'gpt-4o-mini')
+# JSON-файл с правилами маршрутизации вместо DEFAULT_RULES
+ROUTING_RULES_PATH = os.getenv('ROUTING_RULES_PATH')
+
+# Признаки вопроса, дешёвые для вычисления локально
+RouteFeatures = namedtuple('RouteFeatures', ['tokens', 'intent', 'catalog_score', 'history_turns'])
+
+# Правила проверяются по порядку, первое подходящее выбирает модель; если не подошло
+# ни одно — DEFAULT_MODEL. Условия правила (все необязательные):
+#   max_tokens — длина вопроса не больше, intents — тип вопроса из списка,
+#   min_catalog_score / max_catalog_score — лучшая оценка раздела каталога,
+#   max_history — число реплик в памяти диалога не больше.
+DEFAULT_RULES = [
+    # Короткий вопрос, однозначно попадающий в каталог: ответ — пересказ найденных цен
+    {"model": CHEAP_MODEL, "max_tokens": 30, "intents": ["price", "question"], "min_catalog_score": 15,
+     "max_history": 1},
+    # Реплики вроде «спасибо», «хорошо», не связанные с услугами
+    {"model": CHEAP_MODEL, "max_tokens": 6, "max_catalog_score": 12, "max_history": 0},
+]
+
+def load_rules(path=ROUTING_RULES_PATH):
+    if not path:
+        return DEFAULT_RULES
+    with open(path, encoding='utf-8') as rules_file:
+        return json.load(rules_file)
+
+ROUTING_RULES = load_rules()
+
+def rule_matches(rule, features):
+    return (
+        features.tokens <= rule.get("max_tokens", float('inf'))
+        and ("intents" not in rule or features.intent in rule["intents"])
+        and features.catalog_score >= rule.get("min_catalog_score", float('-inf'))
+        and features.catalog_score <= rule.get("max_catalog_score", float('inf'))
+        and features.history_turns <= rule.get("max_history", float('inf'))
+    )
+
+# Выбор модели для вопроса
+def choose_model(features, rules=None):
+    for rule in ROUTING_RULES if rules is None else rules:
+        if rule_matches(rule, features):
+            return rule["model"]
+    return DEFAULT_MODEL
+
+# Офлайн-сравнение: каждый вопрос из файла отправляется в обе модели, печатаются
+# задержка и стоимость каждой и итог для маршрутизации против DEFAULT_MODEL для всех.
+# python routing.py questions.txt [--language ru]
+# Файл — по вопросу в строке или JSON-строки {"question": ..., "language": ...}.
+async def evaluate(path, default_language):
+    import bot
+    import llm
+    from usage import cached_prompt_tokens, call_cost
+
+    await llm.open_session(None)
+    routed_cost = default_cost = routed_latency = default_latency = 0.0
+    count = 0
+    try:
+        with open(path, encoding='utf-8') as questions:
+            for line in questions:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line) if line.startswith('{') else {"question": line}
+                question = record["question"].lower()
+                language = record.get("language", default_language)
+                features, messages = bot.routing_features(language, question)
+                routed_model = choose_model(features)
+                print(f"{question!r} -> {routed_model} {features}")
+
+                results = {}
+                for model in dict.fromkeys([DEFAULT_MODEL, routed_model]):
+                    started = time.monotonic()
+                    response = await llm.chat_completion(model=model, messages=messages)
+                    latency = time.monotonic() - started
+                    cost = call_cost(model, response.usage.prompt_tokens, response.usage.completion_tokens,
+                                     cached_prompt_tokens(response.usage))
+                    results[model] = (latency, cost)
+                    print(f"  {model:<14} {latency:6.2f} s  ${cost:.5f}  "
+                          f"{response.choices[0].message['content'].strip()[:80]!r}")
+
+                count += 1
+                default_latency += results[DEFAULT_MODEL][0]
+                default_cost += results[DEFAULT_MODEL][1]
+                routed_latency += results[routed_model][0]
+                routed_cost += results[routed_model][1]
+    finally:
+        await llm.close_session(None)
+
+    if count:
+        print(f"\n{count} questions")
+        print(f"all {DEFAULT_MODEL}: avg {default_latency / count:.2f} s, total ${default_cost:.4f}")
+        print(f"routed{'':<{len(DEFAULT_MODEL) - 2}}: avg {routed_latency / count:.2f} s, total ${routed_cost:.4f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение маршрутизации моделей на записанных вопросах")
+    parser.add_argument('questions')
+    parser.add_argument('--language', default='ru')
+    args = parser.parse_args()
+    asyncio.run(evaluate(args.questions, args.language))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from asgi import read_body, send_response
+from updates import HANDLED_KINDS, peek_update
+
+load_dotenv()
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+# Адреса шардов: каждый шард — отдельный процесс webhook:app со своей памятью (user_data)
+SHARD_URLS = [url.strip() for url in os.getenv('SHARD_URLS', '').split(',') if url.strip()]
+SHARD_TIMEOUT = float(os.getenv('SHARD_TIMEOUT', 10))
+# Сколько секунд не отправлять обновления на шард, который не ответил
+SHARD_RETRY_AFTER = float(os.getenv('SHARD_RETRY_AFTER', 5))
+
+# Шарды, временно исключённые из распределения: url -> время, до которого шард недоступен
+down_until = {}
+session = None
+
+# Вес шарда для ключа (rendezvous hashing). Чат всегда попадает на шард с наибольшим весом,
+# поэтому при добавлении или удалении шарда переезжают только чаты этого шарда (~1/N),
+# а не все чаты, как при hash(chat_id) % N.
+def shard_weight(shard, key):
+    digest = hashlib.blake2b(f"{shard}|{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+# Шарды в порядке предпочтения для ключа
+def rank_shards(key, shards=None):
+    shards = SHARD_URLS if shards is None else shards
+    return sorted(shards, key=lambda shard: shard_weight(shard, key), reverse=True)
+
+# Доступные шарды в порядке предпочтения; недоступные — в конце, на крайний случай
+def route(key):
+    now = time.monotonic()
+    ranked = rank_shards(key)
+    return [shard for shard in ranked if down_until.get(shard, 0) <= now] + \
+        [shard for shard in ranked if down_until.get(shard, 0) > now]
+
+# Пересылка обновления шарду с переходом на следующий при ошибке
+async def forward(scope, receive, send):
+    body = await read_body(receive)
+    summary = peek_update(body)
+    if summary is None:
+        await send_response(send, 400, json.dumps({"ok": False}))
+        return
+    if summary.kind not in HANDLED_KINDS:
+        # Шардам такие обновления не нужны, не тратим на них запрос
+        await send_response(send, 200, json.dumps({"ok": True}))
+        return
+
+    key = summary.chat_id if summary.chat_id is not None else f"update:{summary.update_id}"
+    headers = {'Content-Type': 'application/json'}
+    for name, value in scope['headers']:
+        if name == b'x-telegram-bot-api-secret-token':
+            headers['X-Telegram-Bot-Api-Secret-Token'] = value.decode('latin-1')
+
+    for shard in route(key):
+        try:
+            async with session.post(f"{shard}/webhook", data=body, headers=headers) as response:
+                # Ответ шарда передаётся как есть: он может содержать метод Bot API
+                await send_response(send, response.status, await response.read(),
+                                    response.headers.get('Content-Type', 'application/json'))
+                down_until.pop(shard, None)
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.warning("Шард %s недоступен: %s", shard, exc)
+            down_until[shard] = time.monotonic() + SHARD_RETRY_AFTER
+    await send_response(send, 503, json.dumps({"ok": False}))
+
+async def lifespan(receive, send):
+    global session
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=SHARD_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60),
+            )
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await session.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# Фронтовой диспетчер: обновления одного чата всегда уходят на один и тот же шард
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/webhook' and scope['method'] == 'POST':
+        await forward(scope, receive, send)
+    elif scope['path'] == '/' and scope['method'] in ('GET', 'HEAD'):
+        await send_response(send, 200, 'Бот клиники Медива работает!', 'text/plain; charset=utf-8')
+    else:
+        await send_response(send, 404, json.dumps({"ok": False}))
+
+# Запуск шардов и диспетчера: python sharding.py
+def main() -> None:
+    import uvicorn
+
+    shards = int(os.getenv('SHARDS', os.cpu_count() or 1))
+    base_port = int(os.getenv('SHARD_BASE_PORT', 8100))
+    port = int(os.environ.get("PORT", 5000))
+
+    processes = [
+        subprocess.Popen([sys.executable, '-m', 'uvicorn', 'webhook:app',
+                          '--host', '127.0.0.1', '--port', str(base_port + i)],
+                         # У каждого шарда свой файл семантического кэша
+                         env=dict(os.environ, SEMANTIC_CACHE_PATH=f"semantic_cache.{i}.npz"))
+        for i in range(shards)
+    ]
+    SHARD_URLS[:] = [f"http://127.0.0.1:{base_port + i}" for i in range(shards)]
+    try:
+        uvicorn.run(app, host='0.0.0.0', port=port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__":
+    main()
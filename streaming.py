@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from replies import disable_inline_reply
+
+# Не чаще одного редактирования сообщения за столько секунд (лимиты Telegram на правки)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.0))
+# Курсор в конце ещё не законченного ответа
+STREAM_CURSOR = " …"
+
+# Ответ, который показывается пациенту по мере генерации: первый фрагмент отправляется
+# сразу, дальше сообщение редактируется не чаще STREAM_EDIT_INTERVAL, в конце — итоговая правка.
+class StreamingReply:
+    def __init__(self, message: Message, interval=STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.sent = None
+        self.shown = None
+        self.next_edit = 0.0
+        self.started = time.monotonic()
+        self.first_visible = None
+
+    async def _show(self, text):
+        if text == self.shown:
+            return
+        try:
+            if self.sent is None:
+                # Отправленное сообщение будет редактироваться, в теле вебхука его вернуть нельзя
+                disable_inline_reply()
+                self.sent = await self.message.reply_text(text)
+                self.first_visible = time.monotonic() - self.started
+            else:
+                await self.sent.edit_text(text)
+            self.shown = text
+        except RetryAfter as exc:
+            self.next_edit = time.monotonic() + exc.retry_after
+        except BadRequest as exc:
+            if 'not modified' not in str(exc).lower():
+                raise
+
+    # Промежуточный текст: показывается, если с прошлой правки прошло достаточно времени
+    async def update(self, text):
+        text = text.strip()
+        now = time.monotonic()
+        if not text or (self.sent is not None and now < self.next_edit):
+            return
+        self.next_edit = now + self.interval
+        await self._show(text + STREAM_CURSOR)
+
+    # Итоговый текст: одна отправка, если ответ пришёл целиком (кэш, каталог), иначе последняя правка.
+    # Промежуточную правку при RetryAfter можно пропустить, итоговую — нет: ждём и повторяем.
+    async def finish(self, text):
+        while True:
+            try:
+                if self.sent is None:
+                    self.sent = await self.message.reply_text(text)
+                elif text != self.shown:
+                    await self.sent.edit_text(text)
+                self.shown = text
+                return
+            except RetryAfter as exc:
+                await asyncio.sleep(exc.retry_after)
+            except BadRequest as exc:
+                if 'not modified' not in str(exc).lower():
+                    raise
+                self.shown = text
+                return
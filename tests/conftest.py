@@ -0,0 +1,41 @@
+import json
+import os
+
+import pytest
+from telegram.request import BaseRequest
+
+# Тесты не ходят в Telegram и OpenAI и не пишут файлы в корень репозитория
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:test')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ['USAGE_LOG_PATH'] = ''
+os.environ['SEMANTIC_CACHE_PATH'] = ''
+os.environ['STREAM_REPLIES'] = '0'
+
+# Транспорт Bot API без сети: getMe возвращает тестового бота, остальные методы — успех
+class LocalRequest(BaseRequest):
+    def __init__(self, connection_pool_size=1):
+        self.calls = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls.append((endpoint, request_data.parameters if request_data is not None else {}))
+        if endpoint == 'getMe':
+            result = {"id": 123456, "is_bot": True, "first_name": "Mediva", "username": "mediva_test_bot"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode('utf-8')
+
+# Приложение вебхука с локальным транспортом вместо Bot API
+@pytest.fixture
+def local_webhook(monkeypatch):
+    import bot
+    import webhook
+
+    monkeypatch.setattr(webhook, 'build_application', lambda request_class=None: bot.build_application(LocalRequest))
+    return webhook
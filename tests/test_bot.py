@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import bot
+import llm
+from benchmarks.openai_stand_in import ANSWER, StandIn
+from endpoints import Endpoint, EndpointPool
+
+def ask(chat_id, question, language='ru'):
+    return asyncio.run(bot.answer_question(language, question, None, chat_id))
+
+def test_follow_up_price_uses_previous_question():
+    assert "Флеболог > Первичная консультация" in ask(101, "сколько стоит первичная консультация флеболога")
+    answer = ask(101, "а сколько стоит повторная?")
+    assert "Флеболог > Повторная консультация" in answer
+    assert "Первичная" not in answer
+
+def test_follow_up_price_unrelated_to_previous_question_is_not_answered_from_catalog():
+    ask(106, "сколько стоит лазерная эпиляция голеней")
+    context = bot.MEMORY.last_question(106)
+    assert bot.CATALOG_INDEX.resolve_price("а для мужчин цена?", context) == []
+
+def test_new_price_question_in_session_keeps_fast_path():
+    ask(102, "сколько стоит лазерная эпиляция подмышек")
+    assert "Дерматовенеролог > Дерматоскопия" in ask(102, "сколько стоит дерматоскопия")
+
+def test_standalone_question_in_session_uses_cache():
+    ask(103, "сколько стоит лазерная эпиляция подмышек")
+    question = "что такое биоревитализация"
+    bot.RESPONSE_CACHE.put(bot.RESPONSE_CACHE.key('ru', question), "ответ из кэша", 0.0, bot.SYSTEM_PROMPTS.version)
+    assert not bot.is_follow_up(question, 103, 'question')
+    assert ask(103, question) == "ответ из кэша"
+
+def test_follow_up_detection():
+    ask(104, "сколько стоит лазерная эпиляция голеней")
+    assert bot.is_follow_up("а для мужчин?", 104, 'question')
+    assert bot.is_follow_up("это больно?", 104, 'question')
+    assert bot.is_follow_up("сколько стоит повторная?", 104, 'price')
+    assert not bot.is_follow_up("а для мужчин?", 105, 'question')
+
+def test_rejected_request_gets_degraded_answer(monkeypatch):
+    async def rejected(*args, **kwargs):
+        raise openai.error.InvalidRequestError("context too long", "messages")
+
+    monkeypatch.setattr(bot, 'chat_completion', rejected)
+    monkeypatch.setattr(bot, 'TOOL_CALLING', False)
+    answer = ask(107, "что лучше при акне: пилинг или лазер")
+    assert bot.CONTACT_INFO['phone'] in answer
+    assert bot.LLM_GUARD.breaker.failures == 0
+
+# Сообщение Telegram и контекст обработчика без сети
+class LocalMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+        return self
+
+def local_update(chat_id, text):
+    return SimpleNamespace(message=LocalMessage(text), effective_chat=SimpleNamespace(id=chat_id))
+
+def local_context():
+    return SimpleNamespace(user_data={'language': 'ru'},
+                           application=SimpleNamespace(create_task=lambda coroutine, update=None:
+                                                       asyncio.ensure_future(coroutine)))
+
+def test_catalog_answer_is_not_debounced(monkeypatch):
+    monkeypatch.setattr(bot.DEBOUNCER, 'window', 1.5)
+
+    async def run():
+        update = local_update(108, "Сколько стоит лазерная эпиляция подмышек")
+        await bot.handle_message(update, local_context())
+        assert not bot.DEBOUNCER.waiting(108)
+        return update.message.replies
+
+    replies = asyncio.run(run())
+    assert len(replies) == 1 and "подмышечные впадины (женс): 340 000 сум" in replies[0]
+
+def test_message_joins_pending_question(monkeypatch):
+    monkeypatch.setattr(bot.DEBOUNCER, 'window', 1.5)
+
+    async def run():
+        first = local_update(109, "Хотела узнать")
+        await bot.handle_message(first, local_context())
+        assert bot.DEBOUNCER.waiting(109)
+        second = local_update(109, "сколько стоит лазерная эпиляция подмышек")
+        await bot.handle_message(second, local_context())
+        texts = bot.DEBOUNCER.pending[109].texts
+        bot.DEBOUNCER.pending.pop(109).task.cancel()
+        return second.message.replies, texts
+
+    replies, texts = asyncio.run(run())
+    assert replies == []
+    assert texts == ["хотела узнать", "сколько стоит лазерная эпиляция подмышек"]
+
+def booking_context(language='ru'):
+    context = local_context()
+    context.user_data['language'] = language
+    return context
+
+def send(chat_id, context, text):
+    update = local_update(chat_id, text)
+    asyncio.run(bot.handle_message(update, context))
+    return update.message.replies
+
+def test_booking_is_sent_and_confirmed(monkeypatch):
+    sent = []
+    monkeypatch.setattr(bot, 'send_to_zapier', lambda data: sent.append(data) or True)
+    context = booking_context('en')
+    assert send(110, context, "I want to book an appointment") == [bot.BOOKING_PROMPTS['en']]
+    replies = send(110, context, "Ivanova Anna, 12.03.1990, tomorrow 15:00")
+    assert sent == [{"fio": "Ivanova Anna", "dob": "12.03.1990", "time": "tomorrow 15:00", "platform": "Telegram"}]
+    assert len(replies) == 1 and replies[0].startswith("Ivanova Anna, thank you")
+    assert 'booking' not in context.user_data
+
+def test_booking_gives_one_format_hint_then_gives_up(monkeypatch):
+    monkeypatch.setattr(bot, 'send_to_zapier', lambda data: pytest.fail("nothing to send"))
+    context = booking_context()
+    send(111, context, "хочу записаться на прием")
+    assert send(111, context, "Иванова Анна") == [bot.BOOKING_FORMAT_HINTS['ru']]
+    replies = send(111, context, "где вы находитесь")
+    assert 'booking' not in context.user_data
+    assert replies and bot.CONTACT_INFO['address'] in replies[0]
+
+def test_booking_failure_is_reported(monkeypatch):
+    monkeypatch.setattr(bot, 'ZAPIER_WEBHOOK_URL', None)
+    context = booking_context('uz')
+    send(112, context, "qabulga yozilmoqchiman")
+    replies = send(112, context, "Karimov Aziz, 1985-05-01, ertaga 10:00")
+    assert replies == [bot.BOOKING_FAILURES['uz'].format(phone=bot.CONTACT_INFO['phone'])]
+
+@pytest.mark.parametrize("language, text, label", [
+    ('ru', "где вы находитесь", "Адрес"),
+    ('uz', "manzilingiz qanday", "Manzil"),
+    ('en', "where is the clinic located", "Address"),
+])
+def test_contacts_are_localized(language, text, label):
+    replies = send(113, booking_context(language), text)
+    assert replies[0].startswith(f"{label}: ") and "(English)" not in replies[0]
+
+def test_doctors_are_localized_and_filtered():
+    replies = send(114, booking_context('uz'), "tish shifokori kerak")
+    assert replies[0].startswith(bot.DOCTORS_MESSAGES['uz'])
+    assert replies[0].splitlines()[1:] == bot.DOCTORS["recommended"]["dentists"]
+
+def test_streamed_answer_records_upstream_usage(monkeypatch):
+    stand_in = StandIn(9357, delay=0)
+    monkeypatch.setattr(llm, 'pool', EndpointPool([Endpoint("local", api_key="local", api_base=stand_in.url())]))
+    monkeypatch.setattr(bot, 'STREAM_REPLIES', True)
+    monkeypatch.setattr(bot, 'TOOL_CALLING', False)
+    records = []
+    monkeypatch.setattr(bot.USAGE, 'record', lambda *args, **kwargs: records.append((args, kwargs)))
+    shown = []
+
+    async def progress(text):
+        shown.append(text)
+
+    async def run():
+        await stand_in.start()
+        await llm.open_session(None)
+        try:
+            question = "расскажите про лазерную эпиляцию"
+            return await bot.request_answer('ru', question, 'question', question, None, progress)
+        finally:
+            await llm.close_session(None)
+            await stand_in.stop()
+
+    assert asyncio.run(run()) == "".join(ANSWER)
+    (args, kwargs), = records
+    assert args[4:6] == (100, len(ANSWER))
+    assert kwargs == {'cached_tokens': 64}
+    assert shown
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from cache import SemanticCache, SingleFlight
+from catalog import CatalogIndex
+from data import services
+
+CATALOG_INDEX = CatalogIndex(services)
+
+def semantic_cache(question, answer):
+    cache = SemanticCache(capacity=16, path='')
+    cache.put('ru', question, answer, 'v1', CATALOG_INDEX.topic(question))
+    return cache
+
+# Формулировки похожи по триграммам (косинус 0.80–0.85), но спрашивают о разных услугах
+@pytest.mark.parametrize("cached, asked", [
+    ("сколько стоит лазерная эпиляция ног полностью", "сколько стоит лазерная эпиляция рук полностью"),
+    ("консультация дерматолога первичная", "консультация дерматолога повторная"),
+    ("сколько стоит лазерная эпиляция голеней для женщин", "сколько стоит лазерная эпиляция голеней для мужчин"),
+])
+def test_semantic_cache_misses_other_service(cached, asked):
+    cache = semantic_cache(cached, "ответ про другую услугу")
+    assert cache.get('ru', asked, 'v1', CATALOG_INDEX.topic(asked)) is None
+
+def test_semantic_cache_hits_paraphrase():
+    cache = semantic_cache("сколько стоит лазерная эпиляция подмышек", "ответ")
+    asked = "сколько стоит эпиляция подмышек лазером"
+    assert cache.get('ru', asked, 'v1', CATALOG_INDEX.topic(asked)) == "ответ"
+
+def test_semantic_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'semantic_cache.npz')
+    cache = SemanticCache(capacity=16, path=path)
+    cache.put('ru', "что такое биоревитализация", "ответ", 'v1', 7)
+    cache.save()
+    restored = SemanticCache(capacity=16, path=path)
+    restored.load('v1')
+    assert restored.get('ru', "что такое биоревитализация?", 'v1', 7) == "ответ"
+    assert restored.get('ru', "что такое биоревитализация?", 'v1', 8) is None
+
+def test_single_flight_streams_to_every_waiter():
+    async def run():
+        flight = SingleFlight()
+        seen = {'first': [], 'second': []}
+        release = asyncio.Event()
+
+        async def request(progress):
+            await progress("Лазерная")
+            await release.wait()
+            await progress("Лазерная эпиляция")
+            return "Лазерная эпиляция стоит 340 000 сум"
+
+        def listener(name):
+            async def update(text):
+                seen[name].append(text)
+            return update
+
+        first = asyncio.ensure_future(flight.do('key', request, listener('first')))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do('key', request, listener('second')))
+        await asyncio.sleep(0)
+        # Первый ожидающий ушёл (например, его ответ заменило новое сообщение чата)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        answer = await second
+        return answer, seen, flight.started
+
+    answer, seen, started = asyncio.run(run())
+    assert answer == "Лазерная эпиляция стоит 340 000 сум"
+    assert started == 1
+    assert seen['first'] == ["Лазерная"]
+    assert seen['second'] == ["Лазерная эпиляция"]
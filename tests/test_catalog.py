@@ -0,0 +1,19 @@
+import pytest
+
+from catalog import CatalogIndex
+from data import services
+
+INDEX = CatalogIndex(services)
+
+# Лучшая услуга отличается от соседних только словоформой: ответа из каталога нет
+@pytest.mark.parametrize("question", [
+    "сколько стоит эпиляция ног",
+    "сколько стоит эпиляция ног для мужчин",
+    "цена эпиляции рук",
+])
+def test_word_form_near_tie_falls_through(question):
+    assert INDEX.resolve_price(question) == []
+
+def test_exact_service_is_answered():
+    items = INDEX.resolve_price("сколько стоит эпиляция ног полностью")
+    assert items and all("ноги полностью" in item.path[-1] for item in items)
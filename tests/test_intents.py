@@ -0,0 +1,23 @@
+import pytest
+
+from intents import IntentClassifier
+
+CLASSIFIER = IntentClassifier()
+
+@pytest.mark.parametrize("text, expected", [
+    ("показания к ботоксу", 'question'),
+    ("покажите результаты", 'question'),
+    ("кто делает массаж", 'question'),
+    ("какие у вас скидки", 'question'),
+    ("пока", 'goodbye'),
+    ("сколько стоит запись к дерматологу", 'price'),
+    ("how much is an appointment with a dermatologist", 'price'),
+    ("хочу записаться к дерматологу", 'booking'),
+    ("can i book for tomorrow", 'booking'),
+])
+def test_canned_replies_need_keywords(text, expected):
+    assert CLASSIFIER.classify(text).name == expected
+
+def test_email_question_is_english():
+    intent = CLASSIFIER.classify("what is your email")
+    assert (intent.name, intent.language) == ('contacts', 'en')
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+import llm
+from benchmarks.openai_stand_in import ANSWER, StandIn
+from endpoints import Endpoint, EndpointPool, load_endpoints
+
+def test_request_timeout_is_passed_to_openai(monkeypatch):
+    requests = []
+
+    async def acreate(**kwargs):
+        requests.append(kwargs)
+        return {}
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+    asyncio.run(llm.chat_completion(model="gpt-4o", messages=[]))
+    assert requests[0]['request_timeout'] == (llm.OPENAI_CONNECT_TIMEOUT, llm.OPENAI_TIMEOUT)
+
+def test_slow_endpoint_times_out(monkeypatch):
+    stand_in = StandIn(9354, delay=1)
+    monkeypatch.setattr(llm, 'OPENAI_TIMEOUT', 0.2)
+    monkeypatch.setattr(llm, 'pool', EndpointPool([Endpoint("local", api_key="local", api_base=stand_in.url())],
+                                                  max_attempts=1))
+
+    async def run():
+        await stand_in.start()
+        await llm.open_session(None)
+        started = time.monotonic()
+        try:
+            with pytest.raises(openai.error.Timeout):
+                await llm.chat_completion(model="gpt-4o", messages=[])
+            return time.monotonic() - started
+        finally:
+            await llm.close_session(None)
+            await stand_in.stop()
+
+    assert asyncio.run(run()) < 0.8
+
+def test_empty_endpoint_list_is_rejected():
+    with pytest.raises(ValueError):
+        load_endpoints('[]')
+
+def test_stream_reports_usage(monkeypatch):
+    stand_in = StandIn(9356, delay=0)
+    monkeypatch.setattr(llm, 'pool', EndpointPool([Endpoint("local", api_key="local", api_base=stand_in.url())]))
+
+    async def run():
+        await stand_in.start()
+        await llm.open_session(None)
+        usage = {}
+        try:
+            text = "".join([delta async for delta in llm.stream_chat_completion(
+                None, 0, usage, model="gpt-4o", messages=[])])
+        finally:
+            await llm.close_session(None)
+            await stand_in.stop()
+        return text, usage
+
+    text, usage = asyncio.run(run())
+    assert text == "".join(ANSWER)
+    assert usage['prompt_tokens'] == 100 and usage['prompt_tokens_details']['cached_tokens'] == 64
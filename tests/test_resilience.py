@@ -0,0 +1,47 @@
+import asyncio
+
+import openai
+import pytest
+
+from resilience import LLMGuard, UpstreamUnavailable
+
+def test_invalid_request_is_not_hedged_and_keeps_breaker_closed():
+    guard = LLMGuard(deadline=1)
+    calls = []
+
+    async def invalid():
+        calls.append(1)
+        raise openai.error.InvalidRequestError("context too long", "messages")
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        asyncio.run(guard.call(invalid))
+    assert len(calls) == 1
+    assert guard.hedges == 0 and guard.failures == 0
+    assert guard.breaker.failures == 0
+
+def test_endpoint_failure_is_hedged_and_counted():
+    guard = LLMGuard(deadline=1)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise openai.error.APIError("server error")
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(guard.call(failing))
+    assert len(calls) == 2
+    assert guard.breaker.failures == 1
+
+def test_invalid_request_in_stream_is_raised_as_is():
+    guard = LLMGuard(deadline=1)
+
+    async def chunks():
+        yield "Hello"
+        raise openai.error.InvalidRequestError("bad chunk", None)
+
+    async def consume():
+        return [chunk async for chunk in guard.stream(chunks)]
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        asyncio.run(consume())
+    assert guard.failures == 0 and guard.breaker.failures == 0
@@ -0,0 +1,41 @@
+import asyncio
+
+from telegram.error import RetryAfter
+
+from streaming import StreamingReply
+
+# Сообщение Telegram, которое запоминает показанный текст; первые limited правок отклоняются с RetryAfter
+class LocalMessage:
+    def __init__(self, limited=0):
+        self.limited = limited
+        self.text = None
+
+    async def reply_text(self, text):
+        self.text = text
+        return self
+
+    async def edit_text(self, text):
+        if self.limited:
+            self.limited -= 1
+            raise RetryAfter(0)
+        self.text = text
+        return self
+
+def test_finish_retries_rate_limited_edit():
+    async def run():
+        message = LocalMessage()
+        reply = StreamingReply(message, interval=0)
+        await reply.update("Hello wor")
+        message.limited = 2
+        await reply.finish("Hello world!")
+        return message.text
+
+    assert asyncio.run(run()) == "Hello world!"
+
+def test_finish_sends_whole_answer_once():
+    async def run():
+        message = LocalMessage()
+        await StreamingReply(message).finish("Готовый ответ")
+        return message.text
+
+    assert asyncio.run(run()) == "Готовый ответ"
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+import bot
+
+@pytest.mark.parametrize("name, arguments", [
+    ("get_price", '{"path": 5}'),
+    ("get_price", '{"path": null}'),
+    ("search_services", '{"query": null}'),
+    ("search_services", '{"query": ["эпиляция"]}'),
+    ("list_doctors", '["dentists"]'),
+    ("get_price", '{"path": "эпиляция"'),
+    ("get_contacts", '{"unexpected": 1}'),
+])
+def test_bad_arguments_are_reported_to_model(name, arguments):
+    assert "error" in json.loads(bot.TOOL_CALLER.toolbox.call(name, arguments))
+
+def test_failing_function_is_reported_to_model(monkeypatch):
+    def broken(query):
+        raise KeyError(query)
+
+    monkeypatch.setattr(bot.TOOL_CALLER.toolbox, 'search_services', broken)
+    assert json.loads(bot.TOOL_CALLER.toolbox.call("search_services", '{"query": "эпиляция"}')) == \
+        {"error": "search_services failed: 'эпиляция'"}
+
+def test_valid_call_returns_price():
+    result = json.loads(bot.TOOL_CALLER.toolbox.call("get_price", '{"path": "лазерная эпиляция подмышек"}'))
+    assert result and all("price" in item for item in result)
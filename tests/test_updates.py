@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from updates import peek_update
+
+@pytest.mark.parametrize("update", [
+    {"update_id": 1, "message": "x"},
+    {"update_id": 1, "message": {"text": 5, "chat": {"id": 1}}},
+    {"update_id": 1, "edited_message": ["x"]},
+    {"update_id": 1, "callback_query": "x"},
+])
+def test_malformed_update_is_rejected(update):
+    assert peek_update(json.dumps(update)) is None
+
+def test_malformed_chat_has_no_chat_id():
+    summary = peek_update(json.dumps({"update_id": 1, "message": {"text": "привет", "chat": "x"}}))
+    assert (summary.kind, summary.chat_id) == ('text', None)
+
+def test_text_message_is_summarized():
+    summary = peek_update(json.dumps({"update_id": 7, "message": {"text": "/start", "chat": {"id": 42}}}))
+    assert (summary.update_id, summary.chat_id, summary.kind) == (7, 42, 'command')
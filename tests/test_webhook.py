@@ -0,0 +1,134 @@
+import asyncio
+
+import llm
+from benchmarks.openai_stand_in import StandIn
+import endpoints
+from endpoints import Endpoint, EndpointPool
+
+# Прогон ASGI lifespan: startup, проверка check() на запущенном приложении, shutdown
+async def run_lifespan(webhook, check):
+    messages = asyncio.Queue()
+    sent = []
+
+    async def receive():
+        return await messages.get()
+
+    async def send(message):
+        sent.append(message['type'])
+
+    await messages.put({'type': 'lifespan.startup'})
+    task = asyncio.ensure_future(webhook.app({'type': 'lifespan'}, receive, send))
+    while not sent:
+        await asyncio.sleep(0.01)
+    assert sent == ['lifespan.startup.complete']
+    try:
+        await check()
+    finally:
+        await messages.put({'type': 'lifespan.shutdown'})
+        await task
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+def test_lifespan_opens_openai_session(local_webhook):
+    async def check():
+        assert llm.session is not None
+        assert not llm.session.closed
+
+    asyncio.run(run_lifespan(local_webhook, check))
+    assert llm.session is None
+
+def test_lifespan_persists_semantic_cache(local_webhook, monkeypatch, tmp_path):
+    import bot
+
+    monkeypatch.setattr(bot.SEMANTIC_CACHE, 'path', str(tmp_path / 'semantic_cache.npz'))
+    bot.SEMANTIC_CACHE.clear()
+    version = bot.SYSTEM_PROMPTS.version
+
+    async def remember():
+        bot.SEMANTIC_CACHE.put('ru', "что такое биоревитализация", "ответ", version)
+
+    async def recall():
+        assert bot.SEMANTIC_CACHE.get('ru', "что такое биоревитализация?", version) == "ответ"
+
+    asyncio.run(run_lifespan(local_webhook, remember))
+    bot.SEMANTIC_CACHE.clear()
+    asyncio.run(run_lifespan(local_webhook, recall))
+
+# Запрос в точку доступа через сессию, открытую lifespan
+async def ask_openai():
+    await llm.chat_completion(model="gpt-4o", messages=[{"role": "user", "content": "сколько стоит эпиляция"}])
+
+def test_rate_limit_headers_reach_limiter(local_webhook, monkeypatch):
+    stand_in = StandIn(9351, delay=0, rpm=600, tpm=60000, remaining=0.5)
+    endpoint = Endpoint("local", api_key="local", api_base=stand_in.url(), rpm=100, tpm=1000)
+    monkeypatch.setattr(llm, 'pool', EndpointPool([endpoint]))
+
+    async def check():
+        await stand_in.start()
+        try:
+            await ask_openai()
+        finally:
+            await stand_in.stop()
+
+    asyncio.run(run_lifespan(local_webhook, check))
+    assert endpoint.rate_limiter.requests.capacity == 600
+    assert endpoint.rate_limiter.tokens.capacity == 60000
+    assert endpoint.rate_limiter.requests.level <= 300
+    assert endpoint.rate_limiter.tokens.level <= 30000
+
+def test_endpoint_short_of_quota_is_ranked_last(local_webhook, monkeypatch):
+    monkeypatch.setattr(endpoints, 'ENDPOINT_EXPLORE', 0)
+    stand_ins = [StandIn(9352, delay=0, remaining=0.02), StandIn(9353, delay=0)]
+    exhausted, fresh = [Endpoint(name, api_key="local", api_base=stand_in.url())
+                        for name, stand_in in zip(("exhausted", "fresh"), stand_ins)]
+    pool = EndpointPool([exhausted, fresh])
+    monkeypatch.setattr(llm, 'pool', pool)
+
+    async def check():
+        for stand_in in stand_ins:
+            await stand_in.start()
+        try:
+            # Без замеров точки равны, и первый запрос уходит в первую из них
+            await ask_openai()
+            await ask_openai()
+        finally:
+            for stand_in in stand_ins:
+                await stand_in.stop()
+
+    asyncio.run(run_lifespan(local_webhook, check))
+    assert exhausted.headroom() < endpoints.ENDPOINT_QUOTA_RESERVE < fresh.headroom()
+    assert exhausted.requests == 1 and fresh.requests == 1
+    assert pool.candidates()[-1] is exhausted
+
+def test_keys_on_same_url_track_their_own_quota(local_webhook, monkeypatch):
+    monkeypatch.setattr(endpoints, 'ENDPOINT_EXPLORE', 0)
+    stand_in = StandIn(9355, delay=0, key_remaining={"key-b": 0.02})
+    key_a, key_b = [Endpoint(name, api_key=name, api_base=stand_in.url()) for name in ("key-a", "key-b")]
+    pool = EndpointPool([key_a, key_b])
+    monkeypatch.setattr(llm, 'pool', pool)
+
+    async def check():
+        await stand_in.start()
+        try:
+            # Первый запрос уходит в key-a, второй — в ещё не измеренный key-b
+            await ask_openai()
+            await ask_openai()
+        finally:
+            await stand_in.stop()
+
+    asyncio.run(run_lifespan(local_webhook, check))
+    assert key_a.requests == 1 and key_b.requests == 1
+    assert key_b.headroom() < endpoints.ENDPOINT_QUOTA_RESERVE < key_a.headroom()
+    assert pool.candidates()[-1] is key_b
+
+def test_malformed_update_gets_400(local_webhook):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'{"update_id": 1, "message": "x"}', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'path': '/webhook', 'method': 'POST', 'headers': []}
+    asyncio.run(local_webhook.app(scope, receive, send))
+    assert sent[0]['status'] == 400
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+from collections import Counter
+
+from catalog import normalize
+from prompts import estimate_messages_tokens, estimate_tokens
+from usage import cached_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+# Режим вызова функций: модель сама запрашивает нужные данные каталога, контакты и врачей
+TOOL_CALLING = os.getenv('TOOL_CALLING', '0') == '1'
+# Сколько запросов к OpenAI допускается на один вопрос; последний — без вызова функций
+TOOL_MAX_ROUNDS = int(os.getenv('TOOL_MAX_ROUNDS', 4))
+
+# Описания функций для параметра functions Chat Completions
+FUNCTIONS = [
+    {
+        "name": "search_services",
+        "description": "Search the clinic price list. Returns matching sections with services and prices.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string", "description": "Service or procedure, in any language"}},
+            "required": ["query"],
+        },
+    },
+    {
+        "name": "get_price",
+        "description": "Get the price of a service by its path as returned by search_services, "
+                       "e.g. \"Category > Group > Service\".",
+        "parameters": {
+            "type": "object",
+            "properties": {"path": {"type": "string"}},
+            "required": ["path"],
+        },
+    },
+    {
+        "name": "list_doctors",
+        "description": "List the clinic doctors, optionally of one specialty.",
+        "parameters": {
+            "type": "object",
+            "properties": {"specialty": {"type": "string", "enum": ["dermatologists", "dentists"]}},
+        },
+    },
+    {
+        "name": "get_contacts",
+        "description": "Get the clinic address, phone numbers, email and website.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+]
+# Описания функций тоже входят в промпт
+FUNCTIONS_TOKENS = estimate_tokens(json.dumps(FUNCTIONS, ensure_ascii=False))
+
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False)
+
+# Функции для модели поверх данных data.py и индекса каталога, без обращения к сети
+class ToolBox:
+    def __init__(self, catalog_index, contact_info, doctors):
+        self.catalog_index = catalog_index
+        self.contact_info = contact_info
+        self.doctors = doctors
+        self.paths = {normalize(" > ".join(item.path)): item for item in catalog_index.items}
+
+    def search_services(self, query):
+        return self.catalog_index.sections_text(self.catalog_index.top_sections(query))
+
+    def get_price(self, path):
+        item = self.paths.get(normalize(" > ".join(part.strip() for part in path.split(">"))))
+        items = [item] if item is not None else self.catalog_index.resolve_price(path.replace(">", " "))
+        if not items:
+            return to_json({"error": "service not found, use search_services"})
+        return to_json([{"service": " > ".join(item.path), "price": item.price} for item in items])
+
+    def list_doctors(self, specialty=None):
+        if specialty in ("dermatologists", "dentists"):
+            return to_json({specialty: self.doctors[specialty]})
+        return to_json({key: self.doctors[key] for key in ("dermatologists", "dentists")})
+
+    def get_contacts(self):
+        return to_json(self.contact_info)
+
+    def call(self, name, arguments):
+        function = getattr(self, name, None) if name in {spec["name"] for spec in FUNCTIONS} else None
+        if function is None:
+            return to_json({"error": f"unknown function {name}"})
+        # Ошибка функции возвращается модели: вопрос пациента не должен падать из-за аргументов
+        # вида {"path": 5} или {"query": null}
+        try:
+            return function(**json.loads(arguments or "{}"))
+        except (ValueError, TypeError, AttributeError) as error:
+            return to_json({"error": f"invalid arguments: {error}"})
+        except Exception as error:
+            logger.exception("Функция %s завершилась ошибкой", name)
+            return to_json({"error": f"{name} failed: {error}"})
+
+# Цикл вызова функций: пока модель просит функцию, результат добавляется в диалог
+# и запрос повторяется, но не больше max_rounds раз. Статистика показывает число
+# запросов на вопрос, вызовы функций и сколько токенов промпта сэкономлено по
+# сравнению с отправкой всего каталога (baseline_tokens).
+class ToolCaller:
+    def __init__(self, toolbox, max_rounds=TOOL_MAX_ROUNDS):
+        self.toolbox = toolbox
+        self.max_rounds = max_rounds
+        self.questions = 0
+        self.round_trips = 0
+        self.exhausted = 0
+        self.calls = Counter()
+        self.prompt_tokens = 0
+        self.baseline_tokens = 0
+
+    # complete(messages, function_call) — запрос к OpenAI; возвращает ответ и суммы
+    # (оценка промпта, prompt_tokens, completion_tokens, cached_tokens) по всем запросам
+    async def run(self, complete, messages, baseline_tokens):
+        messages = list(messages)
+        estimated = prompt_tokens = completion_tokens = cached_tokens = 0
+        self.questions += 1
+        for round_number in range(self.max_rounds):
+            last_round = round_number == self.max_rounds - 1
+            estimated += estimate_messages_tokens(messages) + FUNCTIONS_TOKENS
+            response = await complete(messages, "none" if last_round else "auto")
+            self.round_trips += 1
+            prompt_tokens += response.usage.prompt_tokens
+            completion_tokens += response.usage.completion_tokens
+            cached_tokens += cached_prompt_tokens(response.usage)
+            message = response.choices[0].message
+            function_call = message.get('function_call')
+            if not function_call:
+                break
+            name, arguments = function_call['name'], function_call.get('arguments')
+            self.calls[name] += 1
+            messages.append({"role": "assistant", "content": None,
+                             "function_call": {"name": name, "arguments": arguments}})
+            messages.append({"role": "function", "name": name, "content": self.toolbox.call(name, arguments)})
+        else:
+            self.exhausted += 1
+            logger.warning("Модель не ответила за %d запросов с функциями", self.max_rounds)
+        self.prompt_tokens += prompt_tokens
+        self.baseline_tokens += baseline_tokens
+        return (message.get('content') or "").strip(), (estimated, prompt_tokens, completion_tokens, cached_tokens)
+
+    def stats(self):
+        return {
+            "questions": self.questions,
+            "round_trips": self.round_trips,
+            "round_trips_per_question": round(self.round_trips / self.questions, 2) if self.questions else 0.0,
+            "exhausted": self.exhausted,
+            "calls": dict(self.calls),
+            "prompt_tokens": self.prompt_tokens,
+            "saved_prompt_tokens": self.baseline_tokens - self.prompt_tokens,
+        }
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, в которых есть объект сообщения с чатом
+MESSAGE_KEYS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+# chat_id сообщения из сырого JSON; None, если поля нет или оно не того типа
+def message_chat_id(message):
+    chat = message.get('chat') if isinstance(message, dict) else None
+    return chat.get('id') if isinstance(chat, dict) else None
+
+# chat_id из сырого JSON обновления, без построения объекта Update
+def update_chat_id(data):
+    for key in MESSAGE_KEYS:
+        message = data.get(key)
+        if message:
+            return message_chat_id(message)
+    callback_query = data.get('callback_query')
+    if isinstance(callback_query, dict):
+        return message_chat_id(callback_query.get('message'))
+    return None
+
+# Краткие сведения об обновлении, нужные до построения объекта Update
+UpdateSummary = namedtuple('UpdateSummary', ['update_id', 'chat_id', 'kind', 'text', 'data'])
+
+# Виды обновлений, для которых в боте есть обработчики (CommandHandler и MessageHandler(TEXT))
+HANDLED_KINDS = frozenset(['text', 'command'])
+
+# Разбор тела вебхука: один json.loads и чтение нескольких полей верхнего уровня.
+# Полный Update.de_json строится позже и только для обновлений, которые дойдут до обработчика.
+# Возвращает None, если тело не похоже на обновление Telegram (в том числе если
+# сообщение — не объект или его текст — не строка): вебхук ответит 400.
+def peek_update(body):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+        return None
+    if any(key in data and not isinstance(data[key], dict) for key in MESSAGE_KEYS + ('callback_query',)):
+        return None
+
+    message = data.get('message')
+    if message:
+        text = message.get('text')
+        if text is None:
+            # Стикеры, фото, служебные сообщения — обработчиков для них нет
+            kind = 'other_message'
+        elif not isinstance(text, str):
+            return None
+        elif text.startswith('/'):
+            kind = 'command'
+        else:
+            kind = 'text'
+        return UpdateSummary(data['update_id'], message_chat_id(message), kind, text, data)
+
+    for key in MESSAGE_KEYS[1:]:
+        if key in data:
+            return UpdateSummary(data['update_id'], update_chat_id(data), key, None, data)
+    return UpdateSummary(data['update_id'], update_chat_id(data), 'other', None, data)
+
+# Планировщик обновлений: разные чаты обрабатываются параллельно,
+# обновления одного чата — строго по очереди, общее число задач ограничено.
+#
+# Для каждого чата хранится своя очередь. Чат попадает в очередь готовых (ready),
+# только если у него есть необработанные обновления и ни один обработчик его не держит,
+# поэтому два обновления одного чата никогда не выполняются одновременно.
+# После каждого обновления чат уходит в конец очереди готовых — один активный
+# пациент не может занять все обработчики.
+class ChatScheduler:
+    def __init__(self, process, concurrency, capacity):
+        self.process = process
+        self.concurrency = concurrency
+        self.capacity = capacity
+        self.chats = {}
+        self.ready = asyncio.Queue()
+        self.pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.workers = []
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self.workers.append(asyncio.create_task(self.work()))
+
+    async def stop(self, timeout):
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не успели обработать %s обновлений до остановки", self.pending)
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+
+    def qsize(self):
+        return self.pending
+
+    # Постановка обновления в очередь чата; при переполнении — asyncio.QueueFull
+    def submit(self, key, item):
+        if self.pending >= self.capacity:
+            raise asyncio.QueueFull
+        self.pending += 1
+        self.idle.clear()
+        queue = self.chats.get(key)
+        if queue is None:
+            self.chats[key] = deque([item])
+            self.ready.put_nowait(key)
+        else:
+            queue.append(item)
+
+    async def work(self):
+        while True:
+            key = await self.ready.get()
+            queue = self.chats[key]
+            item = queue.popleft()
+            try:
+                await self.process(item)
+            except Exception:
+                logger.exception("Ошибка при обработке обновления")
+            finally:
+                self.pending -= 1
+                if queue:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.chats[key]
+                if not self.pending:
+                    self.idle.set()
+
+# Окно дедупликации по update_id. Telegram выдаёт update_id по возрастанию, поэтому
+# достаточно помнить последние WINDOW номеров: бит i в кольцевой битовой маске
+# отмечает update_id, для которого update_id % WINDOW == i.
+# Память постоянная (WINDOW бит), проверка и отметка — O(1) (сдвиг окна — амортизированно).
+class UpdateDeduplicator:
+    def __init__(self, window):
+        self.window = window
+        self.bits = bytearray((window + 7) // 8)
+        self.highest = None
+        self.duplicates = 0
+        self.resets = 0
+
+    def _flip(self, update_id, value):
+        index = update_id % self.window
+        mask = 1 << (index & 7)
+        if value:
+            self.bits[index >> 3] |= mask
+        else:
+            self.bits[index >> 3] &= ~mask
+
+    def _test(self, update_id):
+        index = update_id % self.window
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    # True, если обновление новое (и отмечает его), False — если это повтор
+    def check(self, update_id):
+        if self.highest is None:
+            self.highest = update_id
+            self._flip(update_id, True)
+            return True
+
+        if update_id > self.highest:
+            # Сдвиг окна: очищаем биты номеров, которые из него выпали
+            shift = update_id - self.highest
+            if shift >= self.window:
+                self.bits[:] = bytes(len(self.bits))
+            else:
+                for old_id in range(self.highest + 1, update_id + 1):
+                    self._flip(old_id, False)
+            self.highest = update_id
+            self._flip(update_id, True)
+            return True
+
+        if update_id <= self.highest - self.window:
+            # Повторы приходят в пределах окна. Номер далеко позади означает, что Telegram
+            # начал нумерацию заново (так бывает после недели без обновлений)
+            self.resets += 1
+            self.bits[:] = bytes(len(self.bits))
+            self.highest = update_id
+            self._flip(update_id, True)
+            return True
+
+        if self._test(update_id):
+            self.duplicates += 1
+            return False
+        self._flip(update_id, True)
+        return True
+
+    # Снять отметку, если обновление не было принято и Telegram пришлёт его повторно
+    def forget(self, update_id):
+        if self.highest is not None and self.highest - self.window < update_id <= self.highest:
+            self._flip(update_id, False)
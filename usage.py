@@ -0,0 +1,114 @@
+import argparse
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Журнал вызовов OpenAI (по строке JSON на вызов) для отчётов; пустое значение — не писать
+USAGE_LOG_PATH = os.getenv('USAGE_LOG_PATH', 'usage.jsonl')
+
+# Цена за 1M токенов в долларах: (prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o": (5.00, 15.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+# Токены префикса, найденного в кэше OpenAI, стоят дешевле обычных
+CACHED_PROMPT_PRICE_RATIO = 0.5
+
+# Поля, по которым группируются агрегаты, и поля, которые суммируются
+AGGREGATE_FIELDS = ('day', 'language', 'intent', 'model')
+SUM_FIELDS = ("estimated_prompt_tokens", "prompt_tokens", "cached_tokens", "completion_tokens", "cost", "latency")
+
+def call_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    prompt_cost = (prompt_tokens - cached_tokens + cached_tokens * CACHED_PROMPT_PRICE_RATIO) * prompt_price
+    return (prompt_cost + completion_tokens * completion_price) / 1_000_000
+
+# Сколько токенов промпта OpenAI взял из кэша префиксов (usage.prompt_tokens_details.cached_tokens);
+# старые модели и совместимые серверы этого поля не присылают
+def cached_prompt_tokens(usage):
+    details = usage.get('prompt_tokens_details') or {}
+    return details.get('cached_tokens') or 0
+
+# Учёт токенов и стоимости каждого вызова OpenAI с агрегатами по дню, языку,
+# типу вопроса и модели. estimated_prompt_tokens — локальная оценка до вызова,
+# prompt_tokens/completion_tokens — поле usage из ответа (потоковый ответ присылает его
+# в последнем фрагменте; если его нет, используется локальная оценка и запись
+# помечается estimated),
+# cached_tokens — часть промпта, которую OpenAI взял из кэша префиксов.
+class UsageLedger:
+    def __init__(self, log_path=USAGE_LOG_PATH):
+        self.log_path = log_path
+        self.totals = defaultdict(lambda: defaultdict(float))
+
+    def record(self, model, language, intent, estimated_prompt_tokens, prompt_tokens, completion_tokens,
+               latency, estimated=False, cached_tokens=0):
+        entry = {
+            "ts": round(time.time(), 3),
+            "day": date.today().isoformat(),
+            "model": model,
+            "language": language,
+            "intent": intent,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": round(call_cost(model, prompt_tokens, completion_tokens, cached_tokens), 6),
+            "latency": round(latency, 3),
+            "estimated": estimated,
+        }
+        add_entry(self.totals, entry)
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as log:
+                    log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.exception("Не удалось записать журнал вызовов OpenAI")
+        return entry
+
+    def stats(self):
+        return aggregates_to_dict(self.totals)
+
+# Добавление записи в агрегаты: значения полей by (день, язык, ...) -> суммы
+def add_entry(totals, entry, by=AGGREGATE_FIELDS):
+    bucket = totals[tuple(entry[field] for field in by)]
+    bucket["calls"] += 1
+    for field in SUM_FIELDS:
+        # В записях, сделанных до появления поля, его нет
+        bucket[field] += entry.get(field, 0)
+
+def aggregates_to_dict(totals, by=AGGREGATE_FIELDS):
+    return [
+        dict(zip(by, key), **{field: round(value, 6) for field, value in bucket.items()})
+        for key, bucket in sorted(totals.items())
+    ]
+
+# Отчёт по журналу: python usage.py [--log usage.jsonl] [--by day language intent model]
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Токены и стоимость вызовов OpenAI")
+    parser.add_argument('--log', default=USAGE_LOG_PATH or 'usage.jsonl')
+    parser.add_argument('--by', nargs='+', default=['day', 'language', 'intent'], choices=AGGREGATE_FIELDS)
+    args = parser.parse_args()
+
+    totals = defaultdict(lambda: defaultdict(float))
+    with open(args.log, encoding='utf-8') as log:
+        for line in log:
+            add_entry(totals, json.loads(line), args.by)
+
+    header = " ".join(f"{field:<12}" for field in args.by)
+    print(f"{header} {'calls':>7} {'prompt':>10} {'cached':>10} {'estimate':>10} {'completion':>10} "
+          f"{'cost $':>10} {'avg s':>7}")
+    for key, bucket in sorted(totals.items()):
+        columns = " ".join(f"{str(value):<12}" for value in key)
+        print(f"{columns} {int(bucket['calls']):>7} {int(bucket['prompt_tokens']):>10} {int(bucket['cached_tokens']):>10} "
+              f"{int(bucket['estimated_prompt_tokens']):>10} {int(bucket['completion_tokens']):>10} "
+              f"{bucket['cost']:>10.4f} {bucket['latency'] / bucket['calls']:>7.2f}")
+
+if __name__ == "__main__":
+    main()
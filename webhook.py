@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+
+from telegram import Update
+
+from asgi import read_body, send_response
+from bot import (DEBOUNCER, INTENT_CLASSIFIER, LLM_GUARD, MEMORY, RESPONSE_CACHE, SEMANTIC_CACHE, SINGLE_FLIGHT,
+                 SYSTEM_PROMPTS, TOOL_CALLER, USAGE, build_application)
+from llm import close_session, open_session, pool
+from replies import InlineReplyRequest, inline_reply
+from updates import HANDLED_KINDS, ChatScheduler, UpdateDeduplicator, peek_update
+
+logger = logging.getLogger(__name__)
+
+# Настройки очереди обновлений
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+# Сколько обновлений (из разных чатов) обрабатываются одновременно
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 8))
+# Поведение при переполнении очереди: 'retry' — попросить Telegram повторить, 'shed' — ответить заглушкой
+OVERLOAD_POLICY = os.getenv('OVERLOAD_POLICY', 'retry')
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 10))
+# Отвечать первым сообщением обработчика прямо в теле ответа вебхука
+INLINE_REPLIES = os.getenv('INLINE_REPLIES', '0') == '1'
+# Сколько секунд вебхук ждёт такой ответ, прежде чем подтвердить обновление пустым ответом
+INLINE_REPLY_WAIT = float(os.getenv('INLINE_REPLY_WAIT', 0.2))
+# Сколько последних update_id помнить для отсева повторных доставок
+DEDUP_WINDOW = int(os.getenv('DEDUP_WINDOW', 65536))
+# Секрет, переданный в setWebhook(secret_token=...)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+BUSY_MESSAGE = "Извините, сейчас очень много обращений. Пожалуйста, повторите ваш вопрос через пару минут."
+
+# Приложение Telegram, одно на процесс воркера
+application = None
+# Планировщик входящих обновлений
+scheduler = None
+# Отсев обновлений, которые Telegram доставил повторно
+deduplicator = UpdateDeduplicator(DEDUP_WINDOW)
+# Обновления без обработчиков, отброшенные до построения Update
+ignored_updates = 0
+# Ответы, отправленные в теле ответа вебхука
+inline_replies = 0
+
+# Передача обновления из очереди в Application.process_update
+async def process_update(item):
+    data, reply_future = item
+    inline_reply.set(reply_future)
+    try:
+        update = Update.de_json(data, application.bot)
+        await application.process_update(update)
+    finally:
+        # Обработчик ничего не отправил — вебхуку больше нечего ждать
+        if reply_future is not None and not reply_future.done():
+            reply_future.cancel()
+
+# Ожидание первого ответа обработчика для тела ответа вебхука
+async def wait_inline_reply(reply_future):
+    await asyncio.wait([reply_future], timeout=INLINE_REPLY_WAIT)
+    if not reply_future.done():
+        # Дальше обработчик отправит ответ обычным запросом к Bot API
+        reply_future.cancel()
+    if reply_future.cancelled():
+        return None
+    return reply_future.result()
+
+# Запуск и остановка приложения Telegram вместе с воркером. Application.post_init и
+# post_shutdown вызываются только из run_polling/run_webhook, поэтому сессия OpenAI
+# и семантический кэш на диске открываются и сохраняются здесь явно.
+async def lifespan(receive, send):
+    global application, scheduler
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                application = build_application(InlineReplyRequest if INLINE_REPLIES else None)
+                await application.initialize()
+                await open_session(application)
+                SEMANTIC_CACHE.load(SYSTEM_PROMPTS.version)
+                await application.start()
+                scheduler = ChatScheduler(process_update, UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+                scheduler.start()
+            except Exception as exc:
+                logger.exception("Не удалось запустить приложение Telegram")
+                await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if scheduler is not None:
+                await scheduler.stop(SHUTDOWN_DRAIN_TIMEOUT)
+            if application is not None:
+                await application.stop()
+                await application.shutdown()
+            await close_session(application)
+            SEMANTIC_CACHE.save()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# Ответ при переполнении очереди
+async def reject_update(send, summary):
+    if OVERLOAD_POLICY == 'shed' and summary.chat_id is not None:
+        # Заглушка уходит прямо в теле ответа вебхука, без отдельного запроса к Bot API
+        reply = {"method": "sendMessage", "chat_id": summary.chat_id, "text": BUSY_MESSAGE}
+        await send_response(send, 200, json.dumps(reply))
+    elif OVERLOAD_POLICY == 'shed':
+        await send_response(send, 200, json.dumps({"ok": True}))
+    else:
+        # Любой ответ кроме 2xx Telegram доставит повторно
+        await send_response(send, 503, json.dumps({"ok": False}))
+
+# Обработчик вебхука: проверяет обновление, ставит его в очередь и сразу отвечает
+async def webhook(scope, receive, send):
+    global ignored_updates, inline_replies
+    if WEBHOOK_SECRET is not None:
+        headers = dict(scope['headers'])
+        if headers.get(b'x-telegram-bot-api-secret-token', b'').decode('latin-1') != WEBHOOK_SECRET:
+            await send_response(send, 403, json.dumps({"ok": False}))
+            return
+
+    summary = peek_update(await read_body(receive))
+    if summary is None:
+        await send_response(send, 400, json.dumps({"ok": False}))
+        return
+
+    if summary.kind not in HANDLED_KINDS:
+        # Правки, стикеры, служебные сообщения: подтверждаем, не строя Update
+        ignored_updates += 1
+        await send_response(send, 200, json.dumps({"ok": True}))
+        return
+
+    if not deduplicator.check(summary.update_id):
+        # Повтор уже принятого обновления: подтверждаем, чтобы Telegram перестал его слать
+        await send_response(send, 200, json.dumps({"ok": True}))
+        return
+
+    # Обновления без чата не связаны порядком, у каждого свой ключ
+    key = summary.chat_id if summary.chat_id is not None else ('update', summary.update_id)
+    reply_future = asyncio.get_running_loop().create_future() if INLINE_REPLIES else None
+    try:
+        scheduler.submit(key, (summary.data, reply_future))
+    except asyncio.QueueFull:
+        logger.warning("Очередь обновлений переполнена, обновление %s отклонено", summary.update_id)
+        deduplicator.forget(summary.update_id)
+        await reject_update(send, summary)
+        return
+
+    if reply_future is not None:
+        reply = await wait_inline_reply(reply_future)
+        if reply is not None:
+            inline_replies += 1
+            await send_response(send, 200, json.dumps(reply))
+            return
+    await send_response(send, 200, json.dumps({"ok": True}))
+
+# Счётчики для мониторинга
+def collect_metrics():
+    return {
+        "updates_pending": scheduler.qsize() if scheduler is not None else 0,
+        "updates_duplicate": deduplicator.duplicates,
+        "update_id_resets": deduplicator.resets,
+        "updates_ignored": ignored_updates,
+        "inline_replies": inline_replies,
+        "response_cache": RESPONSE_CACHE.stats(),
+        "semantic_cache": SEMANTIC_CACHE.stats(),
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "conversation_memory": MEMORY.stats(),
+        "intents": INTENT_CLASSIFIER.stats(),
+        "debounce": DEBOUNCER.stats(),
+        "openai_usage": USAGE.stats(),
+        "tool_calls": TOOL_CALLER.stats(),
+        "openai_guard": LLM_GUARD.stats(),
+        "openai_endpoints": pool.stats(),
+    }
+
+# ASGI приложение: gunicorn -k uvicorn.workers.UvicornWorker webhook:app
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    method = scope['method']
+    if path == '/webhook' and method == 'POST':
+        await webhook(scope, receive, send)
+    elif path == '/' and method in ('GET', 'HEAD'):
+        # Маршрут для проверки работоспособности
+        await send_response(send, 200, 'Бот клиники Медива работает!', 'text/plain; charset=utf-8')
+    elif path == '/metrics' and method == 'GET':
+        await send_response(send, 200, json.dumps(collect_metrics()))
+    else:
+        await send_response(send, 404, json.dumps({"ok": False}))